@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import hashlib
+import math
+import time
+import config
+
+# Streaming per-serial scan behaviour, updated on every recorded scan:
+# - an exponentially decayed scan rate (roughly "scans in the last window")
+# - a HyperLogLog sketch of distinct devices (HLL_REGISTERS bytes per serial)
+# - the last geo fix from meta, for impossible-travel checks
+# State lives in anomaly_state (about 100 bytes per serial) and is read and
+# written in the same transaction as the scan insert. SQLite serializes
+# writers, so every gunicorn worker and thread sees and updates one exact
+# state per serial; an in-process copy per worker would split a serial's
+# scans between workers and undercount bursts and device spread.
+HLL_BITS = 6
+HLL_REGISTERS = 1 << HLL_BITS
+HLL_ALPHA = 0.709  # Bias correction for 64 registers
+EARTH_RADIUS_KM = 6371.0
+
+LOAD_STATE_SQL = "SELECT rate, updated, devices, lat, lon, geo_ts FROM anomaly_state WHERE serial = ?"
+SAVE_STATE_SQL = """
+    INSERT OR REPLACE INTO anomaly_state (serial, rate, updated, devices, lat, lon, geo_ts, flags)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _hll_add(registers, value):
+    """Add a value to a HyperLogLog register array in place"""
+    h = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+    index = h & (HLL_REGISTERS - 1)
+    rest = h >> HLL_BITS
+    rank = (64 - HLL_BITS) - rest.bit_length() + 1
+    if rank > registers[index]:
+        registers[index] = rank
+
+def hll_estimate(registers):
+    """Estimate the number of distinct values added to a register array"""
+    raw = HLL_ALPHA * HLL_REGISTERS ** 2 / sum(2.0 ** -r for r in registers)
+    zeros = registers.count(0)
+    if raw <= 2.5 * HLL_REGISTERS and zeros:
+        # Linear counting is more accurate for small cardinalities
+        return HLL_REGISTERS * math.log(HLL_REGISTERS / zeros)
+    return raw
+
+def _distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points (haversine)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def geo_from_meta(meta):
+    """Return (lat, lon) from scan meta ({"lat", "lon"} or {"geo": {...}}), or None"""
+    if not isinstance(meta, dict):
+        return None
+    geo = meta.get('geo') if isinstance(meta.get('geo'), dict) else meta
+    try:
+        lat, lon = float(geo['lat']), float(geo['lon'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+class SerialState:
+    """Bounded-size behaviour summary for one serial"""
+    
+    __slots__ = ('rate', 'updated', 'devices', 'lat', 'lon', 'geo_ts', 'flags')
+    
+    def __init__(self, rate=0.0, updated=None, devices=None, lat=None, lon=None, geo_ts=None):
+        self.rate = rate
+        self.updated = updated
+        self.devices = bytearray(devices) if devices else bytearray(HLL_REGISTERS)
+        self.lat = lat
+        self.lon = lon
+        self.geo_ts = geo_ts
+        self.flags = []
+    
+    def row(self, serial):
+        return (serial, self.rate, self.updated, bytes(self.devices),
+                self.lat, self.lon, self.geo_ts, ",".join(self.flags))
+
+class AnomalyEngine:
+    """Per-serial velocity, device-spread and travel checks, cheap enough for every scan"""
+    
+    def observe(self, conn, serial, device, meta=None, ts=None):
+        """Record a scan in the serial's state on conn and return the anomaly flags it raises
+        
+        Call inside the transaction that inserts the scan, so the state
+        update commits (or rolls back) with it. Flags: "scan_burst"
+        (decayed scan rate over ANOMALY_BURST_SCANS), "device_spread" (more
+        than ANOMALY_MAX_DEVICES distinct devices) and "impossible_travel"
+        (consecutive geo fixes implying more than ANOMALY_MAX_SPEED_KMH).
+        
+        A ts older than the serial's state (a back-dated import) is not
+        applied: the rate cannot decay backwards and the last geo fix would
+        move back in time. Those scans raise no flags.
+        """
+        ts = time.time() if ts is None else ts
+        geo = geo_from_meta(meta)
+        row = conn.execute(LOAD_STATE_SQL, (serial,)).fetchone()
+        state = SerialState(*row) if row else SerialState()
+        if state.updated is not None and ts < state.updated:
+            return []
+        flags = []
+        
+        # Exponential decay with time constant ANOMALY_RATE_WINDOW
+        if state.updated is not None:
+            elapsed = max(0.0, ts - state.updated)
+            state.rate *= math.exp(-elapsed / config.ANOMALY_RATE_WINDOW)
+        state.rate += 1.0
+        state.updated = ts
+        if state.rate > config.ANOMALY_BURST_SCANS:
+            flags.append("scan_burst")
+        
+        _hll_add(state.devices, device or '')
+        if round(hll_estimate(state.devices)) > config.ANOMALY_MAX_DEVICES:
+            flags.append("device_spread")
+        
+        if geo is not None:
+            if state.lat is not None:
+                km = _distance_km(state.lat, state.lon, *geo)
+                hours = max(ts - state.geo_ts, 1.0) / 3600
+                if km > config.ANOMALY_MIN_TRAVEL_KM and km / hours > config.ANOMALY_MAX_SPEED_KMH:
+                    flags.append("impossible_travel")
+            state.lat, state.lon = geo
+            state.geo_ts = ts
+        
+        state.flags = flags
+        conn.execute(SAVE_STATE_SQL, state.row(serial))
+        return flags
+
+_engine = AnomalyEngine()
+
+def get_engine():
+    """Get the process-wide anomaly engine"""
+    return _engine
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+import argparse
+import gzip
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import config
+import database
+
+# Scans older than the retention window are handled one UTC day at a time.
+# A pass over a day covers its live rows up to a scan id watermark (max_id):
+# they are added to scan_rollups_hourly/daily, appended to a monthly gzip
+# JSON-lines archive, and then deleted in ARCHIVE_DELETE_CHUNK batches so the
+# write lock is only held briefly. scan_archive_log records each step, so an
+# interrupted run resumes without double-counting: the archive size is
+# recorded before appending, and a pass that stopped mid-export truncates
+# back to it and writes again. Rows that reach a closed day later (scan ids
+# are AUTOINCREMENT, so always above the watermark) get another pass instead
+# of being deleted unarchived. scan_stats is all-time and is not touched
+# when scans are archived.
+SCAN_COLUMNS = ("id", "serial", "ts", "device", "meta", "similarity", "visual_flag",
+                "phash_distance", "orb_ratio", "phash")
+
+SELECT_DAY_SQL = f"""
+    SELECT {", ".join(SCAN_COLUMNS)} FROM scans
+    WHERE ts >= ? AND ts < ? AND id <= ?
+    ORDER BY ts, id
+"""
+DAY_MAX_ID_SQL = "SELECT MAX(id), COUNT(*) FROM scans WHERE ts >= ? AND ts < ?"
+DELETE_CHUNK_SQL = """
+    DELETE FROM scans WHERE id IN (
+        SELECT id FROM scans WHERE ts >= ? AND ts < ? AND id <= ? LIMIT ?
+    )
+"""
+# Passes add to existing rollup rows. devices cannot be merged exactly
+# across passes, so a day with late rows keeps the larger count (a lower bound).
+ROLLUP_HOURLY_SQL = """
+    INSERT INTO scan_rollups_hourly (serial, hour, scans, visual_flags, devices)
+    SELECT serial, strftime('%Y-%m-%d %H:00:00', ts), COUNT(*),
+           SUM(IFNULL(visual_flag, 0) = 1), COUNT(DISTINCT IFNULL(device, ''))
+    FROM scans
+    WHERE ts >= ? AND ts < ? AND id <= ?
+    GROUP BY serial, strftime('%Y-%m-%d %H:00:00', ts)
+    ON CONFLICT (serial, hour) DO UPDATE SET
+        scans = scans + excluded.scans,
+        visual_flags = visual_flags + excluded.visual_flags,
+        devices = MAX(devices, excluded.devices)
+"""
+ROLLUP_DAILY_SQL = """
+    INSERT INTO scan_rollups_daily (serial, day, scans, visual_flags, devices)
+    SELECT serial, ?, COUNT(*), SUM(IFNULL(visual_flag, 0) = 1), COUNT(DISTINCT IFNULL(device, ''))
+    FROM scans
+    WHERE ts >= ? AND ts < ? AND id <= ?
+    GROUP BY serial
+    ON CONFLICT (serial, day) DO UPDATE SET
+        scans = scans + excluded.scans,
+        visual_flags = visual_flags + excluded.visual_flags,
+        devices = MAX(devices, excluded.devices)
+"""
+
+def _day_bounds(day):
+    start = datetime.strptime(day, "%Y-%m-%d")
+    return start.strftime("%Y-%m-%d %H:%M:%S"), (start + timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+
+def archive_path(month):
+    """Archive file holding a month's (YYYY-MM) raw scans"""
+    return Path(config.ARCHIVE_DIR) / f"scans-{month}.jsonl.gz"
+
+def _archive_row(row):
+    record = dict(zip(SCAN_COLUMNS, row))
+    try:
+        meta = json.loads(record["meta"] or "{}")
+    except ValueError:
+        meta = record["meta"]
+    if isinstance(meta, dict):
+        # Legacy rows embedded the whole frame; archives keep only the blob reference
+        meta.pop("image", None)
+    record["meta"] = meta
+    return record
+
+def _export_day(conn, day, max_id, offset):
+    """Append a pass's raw scans to the monthly archive as one gzip member
+    
+    The archive is first truncated to `offset`, its size when the pass
+    started exporting, which drops a partial or complete append left by an
+    interrupted run.
+    """
+    start, end = _day_bounds(day)
+    lines = [json.dumps(_archive_row(row), separators=(',', ':')) + "\n"
+             for row in conn.execute(SELECT_DAY_SQL, (start, end, max_id))]
+    
+    path = archive_path(day[:7])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Concatenated gzip members read back as one stream
+    data = gzip.compress("".join(lines).encode()) if lines else b""
+    with open(path, 'ab') as f:
+        f.truncate(offset)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return len(lines)
+
+def _rollup_day(conn, day):
+    """Start a pass: fix its id watermark and add its rows to the rollups; return whether there was one"""
+    start, end = _day_bounds(day)
+    max_id, rows = conn.execute(DAY_MAX_ID_SQL, (start, end)).fetchone()
+    if max_id is None:
+        return False
+    conn.execute(ROLLUP_HOURLY_SQL, (start, end, max_id))
+    conn.execute(ROLLUP_DAILY_SQL, (day, start, end, max_id))
+    conn.execute("""
+        INSERT INTO scan_archive_log (day, state, rows, archive_file, max_id)
+        VALUES (?, 'rolled_up', ?, ?, ?)
+        ON CONFLICT (day) DO UPDATE SET
+            state = 'rolled_up', rows = rows + excluded.rows, max_id = excluded.max_id,
+            archive_offset = NULL, archived_at = CURRENT_TIMESTAMP
+    """, (day, rows, str(archive_path(day[:7])), max_id))
+    return True
+
+def _set_state(conn, day, state):
+    conn.execute("UPDATE scan_archive_log SET state = ? WHERE day = ?", (state, day))
+
+def _start_export(conn, day, offset):
+    conn.execute("UPDATE scan_archive_log SET state = 'exporting', archive_offset = ? WHERE day = ?",
+                 (offset, day))
+
+def _delete_chunk(conn, start, end, max_id):
+    return conn.execute(DELETE_CHUNK_SQL, (start, end, max_id, config.ARCHIVE_DELETE_CHUNK)).rowcount
+
+def archive_day(day):
+    """Roll up, export and delete one day's scans, resuming from scan_archive_log"""
+    conn = database.get_connection()
+    row = conn.execute("SELECT state, max_id, archive_offset FROM scan_archive_log WHERE day = ?",
+                       (day,)).fetchone()
+    state, max_id, offset = row if row else (None, None, None)
+    
+    if state in (None, 'done'):
+        # New day, or rows that arrived after the day was closed
+        if not database.run_write(_rollup_day, day):
+            return 0
+        state, max_id = conn.execute("SELECT state, max_id FROM scan_archive_log WHERE day = ?",
+                                     (day,)).fetchone()
+    if state == 'rolled_up':
+        path = archive_path(day[:7])
+        offset = path.stat().st_size if path.exists() else 0
+        database.run_write(_start_export, day, offset)
+        state = 'exporting'
+    if state == 'exporting':
+        exported = _export_day(conn, day, max_id, offset)
+        database.run_write(_set_state, day, 'exported')
+        print(f"  {day}: {exported} scan(s) archived to {archive_path(day[:7])}")
+        state = 'exported'
+    
+    start, end = _day_bounds(day)
+    deleted = 0
+    while True:
+        count = database.run_write(_delete_chunk, start, end, max_id)
+        deleted += count
+        if count < config.ARCHIVE_DELETE_CHUNK:
+            break
+    database.run_write(_set_state, day, 'done')
+    return deleted
+
+def pending_days(cutoff_day):
+    """Days to archive: interrupted passes first, then days before cutoff_day with live scans"""
+    conn = database.get_connection()
+    # A pass stopped mid-export truncates its month's archive when resumed, so
+    # it must finish before any other day appends to that archive
+    interrupted = [day for (day,) in conn.execute(
+        "SELECT day FROM scan_archive_log WHERE state != 'done' ORDER BY state != 'exporting', day")]
+    first = conn.execute("SELECT MIN(ts) FROM scans").fetchone()[0]
+    if first is None or first[:10] >= cutoff_day:
+        return interrupted
+    
+    days = list(interrupted)
+    day = datetime.strptime(first[:10], "%Y-%m-%d")
+    cutoff = datetime.strptime(cutoff_day, "%Y-%m-%d")
+    while day < cutoff:
+        start, end = _day_bounds(day.strftime("%Y-%m-%d"))
+        # Uses idx_scans_ts, so empty days cost one index probe
+        if (day.strftime("%Y-%m-%d") not in interrupted and
+                conn.execute("SELECT 1 FROM scans WHERE ts >= ? AND ts < ? LIMIT 1", (start, end)).fetchone()):
+            days.append(day.strftime("%Y-%m-%d"))
+        day += timedelta(days=1)
+    return days
+
+def archive_scans(retention_days=None):
+    """Archive every full day of scans older than the retention window"""
+    retention_days = config.SCAN_RETENTION_DAYS if retention_days is None else retention_days
+    # scans.ts is UTC (CURRENT_TIMESTAMP)
+    cutoff_day = (datetime.now(timezone.utc) - timedelta(days=retention_days)).strftime("%Y-%m-%d")
+    days = pending_days(cutoff_day)
+    print(f"Archiving scans before {cutoff_day}: {len(days)} day(s)")
+    
+    deleted = 0
+    for day in days:
+        deleted += archive_day(day)
+    print(f"Archive complete: {deleted} scan(s) removed from the live table")
+    return deleted
+
+def _archived_scans(serial, since, until):
+    """Yield archived scan records in the time range, oldest first"""
+    for path in sorted(Path(config.ARCHIVE_DIR).glob("scans-*.jsonl.gz")):
+        month = path.name[len("scans-"):-len(".jsonl.gz")]
+        if (since and month < since[:7]) or (until and month > until[:7]):
+            continue
+        with gzip.open(path, 'rt') as f:
+            for line in f:
+                record = json.loads(line)
+                if serial and record["serial"] != serial:
+                    continue
+                if (since and record["ts"] < since) or (until and record["ts"] >= until):
+                    continue
+                yield record
+
+def iter_scans(serial=None, since=None, until=None):
+    """Yield scans as dicts across the archives and the live table, oldest first
+    
+    since/until are timestamps in the scans.ts format (until exclusive).
+    Archived rows carry meta as parsed JSON; live rows are returned the
+    same way for consistency.
+    """
+    yield from _archived_scans(serial, since, until)
+    
+    clauses = []
+    params = []
+    for clause, value in (("serial = ?", serial), ("ts >= ?", since), ("ts < ?", until)):
+        if value:
+            clauses.append(clause)
+            params.append(value)
+    sql = f"SELECT {', '.join(SCAN_COLUMNS)} FROM scans WHERE {' AND '.join(clauses) or '1'} ORDER BY ts, id"
+    for row in database.get_connection().execute(sql, params):
+        yield _archive_row(row)
+
+def main():
+    parser = argparse.ArgumentParser(description="Roll up, archive and prune old scans")
+    parser.add_argument("--days", type=int, default=None,
+                        help=f"Keep this many days of raw scans (default: {config.SCAN_RETENTION_DAYS})")
+    parser.add_argument("--query", metavar="SERIAL",
+                        help="Print all scans of a serial from archives and the live table")
+    parser.add_argument("--since", help="With --query: first timestamp (YYYY-MM-DD[ HH:MM:SS])")
+    parser.add_argument("--until", help="With --query: end timestamp, exclusive")
+    args = parser.parse_args()
+    
+    if args.query:
+        for record in iter_scans(args.query, args.since, args.until):
+            print(json.dumps(record))
+        return
+    archive_scans(args.days)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+import argparse
+import sqlite3
+import threading
+import time
+from pathlib import Path
+import common
+
+# database.py connection pooling versus a connection per call, on the verify
+# read and write paths. Pooled connections are per thread, so they only pay
+# off when threads are reused (gunicorn gthread workers). The
+# new_thread_per_request case shows the Werkzeug dev server pattern, where
+# each request runs on a fresh thread and opens its own connection anyway.
+SELECT_ITEM_SQL = "SELECT product, batch FROM items WHERE serial = ?"
+
+def _per_call_write(serial, device):
+    import config
+    import server
+    conn = sqlite3.connect(config.DB_PATH)
+    conn.execute(SELECT_ITEM_SQL, (serial,)).fetchone()
+    server._record_scan(conn, serial, device, "{}", None, 0, None, None, None)
+    conn.commit()
+    conn.close()
+
+def _pooled_write(serial, device):
+    import database
+    import server
+    database.get_connection().execute(SELECT_ITEM_SQL, (serial,)).fetchone()
+    database.run_write(server._record_scan, serial, device, "{}", None, 0, None, None, None)
+
+def _run_writers(write, serials, threads, per_thread):
+    """Run per_thread writes on each of `threads` threads and return (latencies ms, seconds)"""
+    samples = []
+    lock = threading.Lock()
+    
+    def worker(index):
+        local = []
+        for i in range(per_thread):
+            start = time.perf_counter()
+            write(serials[(index * per_thread + i) % len(serials)], f"dev{index}")
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            samples.extend(local)
+    
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+def _thread_per_request(write, serials, requests):
+    """Run each write on a fresh thread, as the Werkzeug dev server does"""
+    samples = []
+    
+    def request(serial):
+        start = time.perf_counter()
+        write(serial, "dev")
+        samples.append((time.perf_counter() - start) * 1000)
+    
+    started = time.perf_counter()
+    for i in range(requests):
+        thread = threading.Thread(target=request, args=(serials[i % len(serials)],))
+        thread.start()
+        thread.join()
+    return samples, time.perf_counter() - started
+
+def run(items, threads, per_thread, iterations):
+    import config
+    import database
+    
+    common.populate_registry(num_items=items, num_scans=0, image_items=0)
+    serials = [row[0] for row in database.get_connection().execute("SELECT serial FROM items")]
+    serial = serials[0]
+    
+    def connect_select_close():
+        conn = sqlite3.connect(config.DB_PATH)
+        conn.execute(SELECT_ITEM_SQL, (serial,)).fetchone()
+        conn.close()
+    
+    results = {
+        "connect_select_close": common.time_calls(connect_select_close, iterations),
+        "pooled_select": common.time_calls(
+            lambda: database.get_connection().execute(SELECT_ITEM_SQL, (serial,)).fetchone(), iterations),
+    }
+    
+    for name, write in (("per_call_write", _per_call_write), ("pooled_write", _pooled_write)):
+        samples, elapsed = _run_writers(write, serials, threads, per_thread)
+        results[name] = dict(common.latency_stats(samples), writes_per_s=round(len(samples) / elapsed, 1))
+    samples, elapsed = _thread_per_request(_pooled_write, serials, threads * per_thread)
+    results["new_thread_per_request"] = dict(common.latency_stats(samples),
+                                             writes_per_s=round(len(samples) / elapsed, 1))
+    
+    for name, stats in results.items():
+        rate = f"  {stats['writes_per_s']:8.1f} writes/s" if 'writes_per_s' in stats else ""
+        print(f"{name:24s} p50 {stats['p50_ms']:8.3f} ms  p99 {stats['p99_ms']:8.3f} ms{rate}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Pooled vs per-call SQLite connections on the verify path")
+    parser.add_argument("--items", type=int, default=1000, help="Registry items")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent writer threads")
+    parser.add_argument("--per-thread", type=int, default=100, help="Verify writes per thread")
+    parser.add_argument("--iterations", type=int, default=2000, help="Timed calls per read benchmark")
+    parser.add_argument("--out", help="Results JSON path (default: benchmarks/results/)")
+    args = parser.parse_args()
+    out_path = Path(args.out).resolve() if args.out else None
+    
+    workspace = common.setup_workspace()
+    try:
+        results = run(args.items, args.threads, args.per_thread, args.iterations)
+    finally:
+        common.cleanup_workspace(workspace)
+    common.save_results("db", vars(args), results, out_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import io
+import time
+from pathlib import Path
+import common
+
+def run(items, batch_items, workers):
+    import generator
+    
+    results = {}
+    
+    # One item per call, as generator.py --create does
+    started = time.perf_counter()
+    samples = []
+    for i in range(items):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            generator.create_qr_item("BENCH", f"ONE{i:06d}", "B0", f"sample_data/qr_ONE{i:06d}.png")
+        samples.append((time.perf_counter() - start) * 1000)
+    elapsed = time.perf_counter() - started
+    results["create_qr_item"] = dict(common.latency_stats(samples),
+                                     items_per_s=round(items / elapsed, 2))
+    
+    # Bulk mode, as generator.py --create-batch does
+    if batch_items:
+        csv_path = Path("batch.csv")
+        with open(csv_path, 'w') as f:
+            for i in range(batch_items):
+                f.write(f"BENCH,BATCH{i:07d},B1\n")
+        started = time.perf_counter()
+        created = generator.create_qr_batch(str(csv_path), workers)
+        elapsed = time.perf_counter() - started
+        results["create_qr_batch"] = {"items": created, "seconds": round(elapsed, 3),
+                                      "items_per_s": round(created / elapsed, 2)}
+    
+    results["peak_rss_mb"] = common.peak_rss_mb()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="QR item generation throughput")
+    parser.add_argument("--items", type=int, default=50, help="Items created one at a time")
+    parser.add_argument("--batch-items", type=int, default=500, help="Items created via --create-batch (0 to skip)")
+    parser.add_argument("--workers", type=int, default=None, help="Batch worker processes")
+    parser.add_argument("--out", help="Results JSON path (default: benchmarks/results/)")
+    args = parser.parse_args()
+    out_path = Path(args.out).resolve() if args.out else None
+    
+    workspace = common.setup_workspace()
+    try:
+        results = run(args.items, args.batch_items, args.workers)
+    finally:
+        common.cleanup_workspace(workspace)
+    for name, stats in results.items():
+        print(f"{name}: {stats}")
+    common.save_results("generator", vars(args), results, out_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+import argparse
+from pathlib import Path
+import common
+
+def run(iterations):
+    import database
+    import feature_store
+    import image_compare
+    import server
+    
+    common.populate_registry(num_items=1, num_scans=0, image_items=1)
+    serial, signature, message_b64 = database.get_connection().execute(
+        "SELECT serial, signature, message FROM items").fetchone()
+    qr_path = str(Path("sample_data") / f"qr_{serial}.png")
+    with open(qr_path, 'rb') as f:
+        canonical_png = f.read()
+    photo = common.camera_like_photo(canonical_png)
+    canonical = feature_store.get_canonical_features(serial, signature, message_b64)
+    canonical_processed = image_compare.preprocess_image(canonical_png)
+    photo_processed = image_compare.preprocess_image(photo)
+    
+    import qr_payload
+    qr_content = qr_payload.stored_qr_content(message_b64, signature)
+    
+    results = {
+        "preprocess_image": common.time_calls(lambda: image_compare.preprocess_image(photo), iterations),
+        "compute_orb_match_ratio": common.time_calls(
+            lambda: image_compare.compute_orb_match_ratio(canonical_processed, photo_processed), iterations),
+        "compare_images_from_path": common.time_calls(
+            lambda: image_compare.compare_images(qr_path, photo), iterations),
+        "compare_images_cached_features": common.time_calls(
+            lambda: image_compare.compare_images(canonical, photo), iterations),
+        "signature_verify": common.time_calls(lambda: server.check_qr_content(qr_content), iterations * 20),
+    }
+    for name, stats in results.items():
+        print(f"{name:32s} p50 {stats['p50_ms']:8.3f} ms  p99 {stats['p99_ms']:8.3f} ms")
+    results["peak_rss_mb"] = common.peak_rss_mb()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Image comparison and signature microbenchmarks")
+    parser.add_argument("--iterations", type=int, default=50, help="Timed calls per benchmark")
+    parser.add_argument("--out", help="Results JSON path (default: benchmarks/results/)")
+    args = parser.parse_args()
+    out_path = Path(args.out).resolve() if args.out else None
+    
+    workspace = common.setup_workspace()
+    try:
+        results = run(args.iterations)
+    finally:
+        common.cleanup_workspace(workspace)
+    common.save_results("image", vars(args), results, out_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+import argparse
+from pathlib import Path
+import common
+
+# Accuracy and speed of the visual comparison on a synthetic labeled set.
+# Every item contributes one genuine capture and three tampered ones:
+#   swapped   capture of another item's label
+#   reprint   same serial with a new nonce and signature (a different code)
+#   patched   genuine label with a square of modules painted over
+# Codes use v2 payloads with seeded nonces and random bytes for signatures,
+# so the set depends only on --items and --seed and runs compare across
+# commits. Nothing here is verified, so no keys or database are needed.
+# The VISUAL_* thresholds in config.py are tuned on this set. Each setting
+# also reports how well each stage's score separates genuine from tampered
+# pairs (ROC AUC of -pHash distance and of SSIM, overall and per tamper
+# kind), which tracks the SSIM size even where the verdicts do not change.
+# A setting fails the run on its own numbers (below --min-accuracy or
+# --min-auc, above --max-far or --max-frr) or against the reference, pairs
+# one at a time at COMPARE_IMAGE_SIZE (losing more than --max-accuracy-drop
+# accuracy or AUC, or admitting or rejecting that much more).
+# pairs_per_s covers the full staged decision (ORB included for ambiguous
+# pairs); kernel_pairs_per_s is pHash plus SSIM on every pair.
+KINDS = ("genuine", "swapped", "reprint", "patched")
+
+def patch_label(png_data, seed):
+    """Paint a black or white square over part of a QR PNG"""
+    import cv2
+    import numpy as np
+    
+    rng = np.random.default_rng(seed)
+    img = cv2.imdecode(np.frombuffer(png_data, np.uint8), cv2.IMREAD_COLOR)
+    height, width = img.shape[:2]
+    side = int(min(height, width) * 0.3)
+    x = rng.integers(width // 4, width - side - width // 10)
+    y = rng.integers(height // 4, height - side - height // 10)
+    img[y:y + side, x:x + side] = 0 if seed % 2 else 255
+    return cv2.imencode('.png', img)[1].tobytes()
+
+def build_labeled_set(num_items, seed=0):
+    """Return (canonical features, preprocessed upload, kind) triples"""
+    import random
+    import image_compare
+    import qr_payload
+    import qr_render
+    
+    rng = random.Random(seed)
+    
+    def render(serial):
+        message = qr_payload.pack_v2(serial, "2024-01-01", rng.randbytes(qr_payload.V2_NONCE_BYTES), "00000000")
+        signature = rng.randbytes(qr_payload.SIGNATURE_BYTES)
+        return qr_render.render_qr_png(qr_payload.encode_qr_content(message, signature))
+    
+    pngs = [render(f"SIM{i:06d}") for i in range(num_items)]
+    samples = []
+    for i, png in enumerate(pngs):
+        features = image_compare.extract_features(png)
+        uploads = {
+            "genuine": png,
+            "swapped": pngs[(i + 1) % num_items],
+            "reprint": render(f"SIM{i:06d}"),
+            "patched": patch_label(png, i),
+        }
+        for kind in KINDS:
+            photo = common.camera_like_photo(uploads[kind], seed=i)
+            samples.append((features, image_compare.preprocess_image(photo), kind))
+    return samples
+
+def decision_stats(samples, results):
+    """Accuracy, false accept/reject rates and per-kind detection for one setting"""
+    correct = {kind: 0 for kind in KINDS}
+    total = {kind: 0 for kind in KINDS}
+    for (_, _, kind), result in zip(samples, results):
+        total[kind] += 1
+        correct[kind] += result['visual_tamper'] == (kind != "genuine")
+    tampered = sum(total[kind] for kind in KINDS[1:])
+    return {
+        "accuracy": round(sum(correct.values()) / len(samples), 4),
+        "false_accept_rate": round(1 - sum(correct[kind] for kind in KINDS[1:]) / tampered, 4),
+        "false_reject_rate": round(1 - correct["genuine"] / total["genuine"], 4),
+        "detected": {kind: round(correct[kind] / total[kind], 4) for kind in KINDS},
+    }
+
+def auc(genuine, tampered):
+    """Probability that a genuine pair scores above a tampered one (ties count half)"""
+    import numpy as np
+    
+    genuine = np.asarray(genuine, dtype=np.float64)[:, None]
+    tampered = np.asarray(tampered, dtype=np.float64)[None, :]
+    wins = (genuine > tampered).sum() + 0.5 * (genuine == tampered).sum()
+    return float(wins / (genuine.size * tampered.size))
+
+def separation_stats(samples, scores):
+    """ROC AUC of each stage's score, genuine vs all tampered and vs each tamper kind"""
+    import numpy as np
+    
+    kinds = np.array([kind for _, _, kind in samples])
+    genuine = kinds == "genuine"
+    stages = {"phash": -np.asarray(scores['phash_distance'], dtype=np.float64), "ssim": scores['ssim']}
+    stats = {f"{stage}_auc": round(auc(values[genuine], values[~genuine]), 4)
+             for stage, values in stages.items()}
+    stats["auc_by_kind"] = {
+        kind: {f"{stage}_auc": round(auc(values[genuine], values[kinds == kind]), 4)
+               for stage, values in stages.items()}
+        for kind in KINDS[1:]
+    }
+    return stats
+
+def _stacked_scores(output):
+    """score_batch output, or a list of per-pair outputs, as one dict of (N,) arrays"""
+    import numpy as np
+    
+    if isinstance(output, dict):
+        return output
+    return {key: np.concatenate([np.ravel(part[key]) for part in output]) for key in output[0]}
+
+def run(num_items, sizes, repeats, seed):
+    import numpy as np
+    import config
+    import image_compare
+    import image_similarity
+    
+    samples = build_labeled_set(num_items, seed)
+    canonicals = [features for features, _, _ in samples]
+    uploads = [processed for _, processed, _ in samples]
+    canonical_stack = np.stack([features['processed'] for features in canonicals])
+    upload_stack = np.stack(uploads)
+    print(f"{len(samples)} labeled pairs ({num_items} items x {len(KINDS)} kinds)")
+    
+    reference = config.COMPARE_IMAGE_SIZE
+    settings = {"per_pair": (
+        lambda: [image_compare.compare_processed_batch([c], [u], reference)[0] for c, u in zip(canonicals, uploads)],
+        lambda: [image_similarity.score_batch(c, u, reference) for c, u in zip(canonical_stack, upload_stack)],
+    )}
+    for size in sizes:
+        settings[f"batch_{size}"] = (
+            lambda size=size: image_compare.compare_processed_batch(canonicals, uploads, size),
+            lambda size=size: image_similarity.score_batch(canonical_stack, upload_stack, size),
+        )
+    
+    def per_second(fn):
+        return round(len(samples) / (common.time_calls(fn, repeats, warmup=1)["p50_ms"] / 1000), 1)
+    
+    results = {}
+    for name, (score, kernel) in settings.items():
+        stats = decision_stats(samples, score())
+        stats.update(separation_stats(samples, _stacked_scores(kernel())))
+        stats["pairs_per_s"] = per_second(score)
+        stats["kernel_pairs_per_s"] = per_second(kernel)
+        results[name] = stats
+        detected = "  ".join(f"{kind} {rate:.0%}" for kind, rate in stats["detected"].items())
+        by_kind = "  ".join(f"{kind} {aucs['ssim_auc']:.3f}" for kind, aucs in stats["auc_by_kind"].items())
+        print(f"{name:10s} {stats['pairs_per_s']:8.1f} pairs/s (kernel {stats['kernel_pairs_per_s']:8.1f})  accuracy {stats['accuracy']:.3f}  "
+              f"FAR {stats['false_accept_rate']:.3f}  FRR {stats['false_reject_rate']:.3f}  ({detected})")
+        print(f"{'':10s} AUC pHash {stats['phash_auc']:.3f}  SSIM {stats['ssim_auc']:.3f}  (SSIM {by_kind})")
+    return results
+
+def check_regressions(results, min_accuracy, min_auc, max_far, max_frr, max_drop):
+    """Return a message per setting that is less accurate, or separates worse, than allowed"""
+    reference = results["per_pair"]
+    failures = []
+    for name, stats in results.items():
+        if stats["accuracy"] < min_accuracy:
+            failures.append(f"{name}: accuracy {stats['accuracy']:.3f} below {min_accuracy:.3f}")
+        for key, label, limit in (("false_accept_rate", "false accept rate", max_far),
+                                  ("false_reject_rate", "false reject rate", max_frr)):
+            if stats[key] > limit:
+                failures.append(f"{name}: {label} {stats[key]:.3f} above {limit:.3f}")
+            if stats[key] - reference[key] > max_drop:
+                failures.append(f"{name}: {label} {stats[key]:.3f} vs {reference[key]:.3f} reference")
+        for key in ("phash_auc", "ssim_auc"):
+            if stats[key] < min_auc:
+                failures.append(f"{name}: {key} {stats[key]:.3f} below {min_auc:.3f}")
+            if reference[key] - stats[key] > max_drop:
+                failures.append(f"{name}: {key} {stats[key]:.3f} vs {reference[key]:.3f} reference")
+        if reference["accuracy"] - stats["accuracy"] > max_drop:
+            failures.append(f"{name}: accuracy {stats['accuracy']:.3f} vs {reference['accuracy']:.3f} reference")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Visual comparison accuracy/speed regression harness")
+    parser.add_argument("--items", type=int, default=50, help="Items in the labeled set (4 pairs each)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the labeled set")
+    parser.add_argument("--sizes", default="128,96,64",
+                        help="Comma-separated SSIM working sizes to score in batch")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed passes over the set per setting")
+    parser.add_argument("--min-accuracy", type=float, default=0.8, help="Fail if any setting scores below this")
+    parser.add_argument("--min-auc", type=float, default=0.9,
+                        help="Fail if a stage's genuine/tampered AUC is below this in any setting (chance is 0.5)")
+    parser.add_argument("--max-far", type=float, default=0.25,
+                        help="Fail if any setting accepts more than this fraction of tampered pairs")
+    parser.add_argument("--max-frr", type=float, default=0.06,
+                        help="Fail if any setting rejects more than this fraction of genuine pairs")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.02,
+                        help="Fail if a setting loses more accuracy or AUC (or admits or rejects more) than this")
+    parser.add_argument("--out", help="Results JSON path (default: benchmarks/results/)")
+    args = parser.parse_args()
+    out_path = Path(args.out).resolve() if args.out else None
+    sizes = [int(size) for size in args.sizes.split(",")]
+    
+    results = run(args.items, sizes, args.repeats, args.seed)
+    common.save_results("similarity", vars(args), results, out_path)
+    
+    failures = check_regressions(results, args.min_accuracy, args.min_auc, args.max_far, args.max_frr,
+                                 args.max_accuracy_drop)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    raise SystemExit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
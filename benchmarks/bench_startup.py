@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+import common
+
+# Runs in a fresh interpreter inside the workspace, so every measurement is a cold start.
+# The first image request starts the comparison pool and imports the imaging stack
+# in its workers unless --warm-pool starts them first, as server startup and
+# gunicorn's post_fork do (pool_warm_up_ms).
+PROBE = r"""
+import json, sys, time
+started = time.perf_counter()
+import server
+import_s = time.perf_counter() - started
+heavy = sorted(m for m in ("cv2", "skimage", "imagehash", "numpy", "PIL") if m in sys.modules)
+
+client = server.app.test_client()
+results = {"import_server_ms": import_s * 1000, "heavy_modules_after_import": heavy}
+
+def post(name, **kwargs):
+    # A distinct request id per request, so none is answered from the dedup cache
+    kwargs.setdefault("headers", {})["Idempotency-Key"] = name
+    start = time.perf_counter()
+    body = client.post("/verify", **kwargs).get_json()
+    results[name] = (time.perf_counter() - start) * 1000
+    if body.get("duplicate") or not body.get("ok"):
+        raise SystemExit(f"{name}: unexpected response {body}")
+    return body
+
+qr, photo_path, warm_pool = sys.argv[1], sys.argv[2], sys.argv[3] == "1"
+post("first_sig_request_ms", json={"qr": qr, "device": "startup"})
+post("second_sig_request_ms", json={"qr": qr, "device": "startup"})
+if warm_pool:
+    import compare_pool
+    start = time.perf_counter()
+    for future in compare_pool.warm_up():
+        future.result()
+    results["pool_warm_up_ms"] = (time.perf_counter() - start) * 1000
+with open(photo_path, "rb") as f:
+    photo = f.read()
+post("first_image_request_ms", query_string={"qr": qr, "device": "startup"},
+     data=photo, content_type="image/jpeg")
+post("second_image_request_ms", query_string={"qr": qr, "device": "startup"},
+     data=photo, content_type="image/jpeg")
+results["process_total_ms"] = (time.perf_counter() - started) * 1000
+print(json.dumps(results))
+"""
+
+def run(runs, warm_pool):
+    qr_contents = common.populate_registry(num_items=1, num_scans=0, image_items=1)
+    with open(Path("sample_data") / "qr_IMG000000.png", 'rb') as f:
+        photo = common.camera_like_photo(f.read())
+    photo_path = Path("photo.jpg")
+    photo_path.write_bytes(photo)
+    
+    env = dict(os.environ, PYTHONPATH=str(common.REPO_ROOT))
+    samples = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, "-c", PROBE, qr_contents[0], str(photo_path),
+                                          "1" if warm_pool else "0"], env=env, text=True)
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    
+    results = {"heavy_modules_after_import": samples[0]["heavy_modules_after_import"]}
+    for key in samples[0]:
+        if key.endswith("_ms"):
+            results[key] = common.latency_stats([sample[key] for sample in samples])
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Server cold-start and first-request latency")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to measure")
+    parser.add_argument("--warm-pool", action="store_true",
+                        help="Start the comparison pool before the image requests, as the server does")
+    parser.add_argument("--out", help="Results JSON path (default: benchmarks/results/)")
+    args = parser.parse_args()
+    out_path = Path(args.out).resolve() if args.out else None
+    
+    workspace = common.setup_workspace()
+    try:
+        results = run(args.runs, args.warm_pool)
+    finally:
+        common.cleanup_workspace(workspace)
+    print(f"Heavy modules loaded by 'import server': {results['heavy_modules_after_import'] or 'none'}")
+    for name, stats in results.items():
+        if name.endswith("_ms"):
+            print(f"{name:28s} p50 {stats['p50_ms']:9.1f} ms  max {stats['max_ms']:9.1f} ms")
+    common.save_results("startup", vars(args), results, out_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# Shared helpers for the benchmark scripts. Benchmarks run inside a throwaway
+# workspace (temp dir with its own keys, database and sample_data) so they
+# never touch the real registry.
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = REPO_ROOT / "benchmarks" / "results"
+
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def setup_workspace():
+    """Create a temp workspace with schema, keys and an empty database, and chdir into it"""
+    workspace = Path(tempfile.mkdtemp(prefix="qr_bench_"))
+    (workspace / "db").mkdir()
+    (workspace / "sample_data").mkdir()
+    shutil.copy(REPO_ROOT / "db" / "schema.sql", workspace / "db" / "schema.sql")
+    os.chdir(workspace)
+    
+    import generator
+    generator.generate_keys()
+    generator.init_database()
+    return workspace
+
+def cleanup_workspace(workspace):
+    os.chdir(REPO_ROOT)
+    shutil.rmtree(workspace, ignore_errors=True)
+
+def populate_registry(num_items, num_scans, image_items=1, seed=0):
+    """Fill the workspace DB with synthetic items and scans
+    
+    The first `image_items` serials are created with create_qr_item
+    (canonical features, plus sample_data/qr_IMGnnnnnn.png for building
+    photos) so image scans have something to compare against. The rest are signed but inserted directly, which keeps
+    multi-million-row registries cheap to build. Returns the list of
+    QR strings for all items.
+    """
+    import config
+    import database
+    import generator
+    import qr_payload
+    
+    rng = random.Random(seed)
+    qr_contents = []
+    for i in range(image_items):
+        generator.create_qr_item("BENCH", f"IMG{i:06d}", "B0", f"sample_data/qr_IMG{i:06d}.png")
+    conn = database.get_connection()
+    for message_b64, signature_b64 in conn.execute("SELECT message, signature FROM items ORDER BY serial"):
+        qr_contents.append(qr_payload.stored_qr_content(message_b64, signature_b64))
+    
+    signing_key = generator.load_signing_key()
+    rows = []
+    for i in range(num_items - image_items):
+        serial = f"SER{i:08d}"
+        payload, message_b64, signature_b64, qr_content = generator.sign_payload(
+            "BENCH", serial, f"B{i % 100}", signing_key)
+        rows.append((serial, "BENCH", f"B{i % 100}", payload["m"], payload["r"],
+                     message_b64, signature_b64, ""))
+        qr_contents.append(qr_content)
+        if len(rows) >= config.BATCH_COMMIT_SIZE:
+            _insert_items(rows)
+            rows = []
+    if rows:
+        _insert_items(rows)
+    
+    serials = [row[0] for row in conn.execute("SELECT serial FROM items")]
+    scans = []
+    for _ in range(num_scans):
+        scans.append((rng.choice(serials), f"dev{rng.randrange(1000)}", "{}", 1.0, 0, None, None))
+        if len(scans) >= config.BATCH_COMMIT_SIZE:
+            _insert_scans(scans)
+            scans = []
+    if scans:
+        _insert_scans(scans)
+    return qr_contents
+
+def _insert_items(rows):
+    import database
+    database.run_write(lambda conn: conn.executemany("""
+        INSERT INTO items (serial, product, batch, mfg, nonce, message, signature, qr_path)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows))
+
+def _insert_scans(rows):
+    import database
+    database.run_write(lambda conn: conn.executemany("""
+        INSERT INTO scans (serial, device, meta, similarity, visual_flag, phash_distance, orb_ratio)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows))
+
+def camera_like_photo(png_data, seed=0):
+    """Turn a canonical QR PNG into a JPEG that looks like a phone capture"""
+    import cv2
+    import numpy as np
+    
+    rng = np.random.default_rng(seed)
+    img = cv2.imdecode(np.frombuffer(png_data, np.uint8), cv2.IMREAD_COLOR)
+    img = cv2.resize(img, (512, 512), interpolation=cv2.INTER_NEAREST)
+    
+    # Slight perspective skew, blur, lighting gradient and sensor noise
+    jitter = rng.uniform(-12, 12, size=(4, 2)).astype(np.float32)
+    corners = np.float32([[0, 0], [511, 0], [511, 511], [0, 511]])
+    matrix = cv2.getPerspectiveTransform(corners, corners + jitter)
+    img = cv2.warpPerspective(img, matrix, (512, 512), borderValue=(255, 255, 255))
+    img = cv2.GaussianBlur(img, (5, 5), 0)
+    gradient = np.linspace(0.85, 1.05, 512, dtype=np.float32)[None, :, None]
+    noise = rng.normal(0, 6, img.shape)
+    img = np.clip(img * gradient + noise, 0, 255).astype(np.uint8)
+    return cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+def time_calls(fn, iterations, warmup=3):
+    """Time repeated calls of fn and return latency stats in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return latency_stats(samples)
+
+def latency_stats(samples_ms):
+    """Summarize latency samples (ms) with mean and p50/p95/p99"""
+    ordered = sorted(samples_ms)
+    if not ordered:
+        return {"count": 0}
+    
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 4)
+    
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 4),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": round(ordered[-1], 4),
+    }
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its children, in MiB"""
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return "unknown"
+
+def save_results(name, params, results, out_path=None):
+    """Write a results JSON (tagged with commit and host) and return its path"""
+    commit = git_commit()
+    document = {
+        "benchmark": name,
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec='seconds'),
+        "host": {"python": platform.python_version(), "machine": platform.machine(),
+                 "cpus": os.cpu_count()},
+        "params": params,
+        "results": results,
+    }
+    if out_path is None:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        out_path = RESULTS_DIR / f"{name}-{commit}.json"
+    with open(out_path, 'w') as f:
+        json.dump(document, f, indent=2)
+    print(f"Results saved to: {out_path}")
+    return out_path
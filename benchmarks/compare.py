@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import argparse
+import json
+
+# Latency-like keys regress when they grow, throughput-like keys when they shrink
+LOWER_IS_BETTER = ("_ms", "seconds", "self", "children", "_rate")
+HIGHER_IS_BETTER = ("per_s", "accuracy", "auc")
+
+def flatten(value, prefix=""):
+    """Flatten nested result dicts into {dotted.key: number}"""
+    flat = {}
+    if isinstance(value, dict):
+        for key, child in value.items():
+            flat.update(flatten(child, f"{prefix}{key}."))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        flat[prefix.rstrip('.')] = value
+    return flat
+
+def direction(key):
+    if key.endswith(HIGHER_IS_BETTER):
+        return 1
+    if key.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline", help="Results JSON from the older commit")
+    parser.add_argument("candidate", help="Results JSON from the newer commit")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="Percent change reported as a regression")
+    args = parser.parse_args()
+    
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    print(f"{baseline['benchmark']}: {baseline['commit']} -> {candidate['commit']}")
+    
+    old = flatten(baseline["results"])
+    new = flatten(candidate["results"])
+    regressions = 0
+    for key in sorted(old.keys() & new.keys()):
+        if old[key] == 0:
+            continue
+        change = (new[key] - old[key]) / old[key] * 100
+        sign = direction(key)
+        marker = ""
+        if sign and change * sign < -args.threshold:
+            marker = "  REGRESSION"
+            regressions += 1
+        print(f"  {key:50s} {old[key]:12.3f} -> {new[key]:12.3f} ({change:+.1f}%){marker}")
+    
+    print(f"{regressions} regression(s) beyond {args.threshold}%")
+    raise SystemExit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
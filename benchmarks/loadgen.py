@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+import common
+
+BOUNDARY = "qrbenchboundary"
+
+def multipart_body(fields, image):
+    """Encode form fields plus a JPEG part the way the scanner page sends them"""
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="image"; filename="scan.jpg"\r\n'
+                 f'Content-Type: image/jpeg\r\n\r\n'.encode() + image + b'\r\n')
+    parts.append(f'--{BOUNDARY}--\r\n'.encode())
+    return b''.join(parts)
+
+def tamper_signature(qr_content):
+    """Flip one signature bit, keeping the QR well-formed"""
+    import qr_payload
+    message_bytes, signature_bytes = qr_payload.decode_qr_content(qr_content)
+    signature_bytes = bytes([signature_bytes[0] ^ 0x01]) + signature_bytes[1:]
+    return qr_payload.encode_qr_content(message_bytes, signature_bytes)
+
+def build_requests(qr_contents, image_qrs, photo, mix, count, seed):
+    """Build (kind, content_type, body) requests following the mix weights
+    
+    Each request carries its own request_id, so the server's idempotency
+    window never answers one from another's cached result.
+    """
+    import generator
+    rng = random.Random(seed)
+    signing_key = generator.load_signing_key()
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    
+    requests = []
+    for i in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        device = f"load{rng.randrange(200)}"
+        request_id = f"load-{seed}-{i}"
+        if kind == "image":
+            body = multipart_body({"qr": rng.choice(image_qrs), "device": device, "request_id": request_id,
+                                    "meta": "{}"}, photo)
+            requests.append((kind, f"multipart/form-data; boundary={BOUNDARY}", body))
+            continue
+        
+        if kind == "sig":
+            qr_content = rng.choice(qr_contents)
+        elif kind == "invalid":
+            qr_content = tamper_signature(rng.choice(qr_contents))
+        elif kind == "unknown":
+            qr_content = generator.sign_payload("BENCH", f"UNKNOWN{i}", "B0", signing_key)[3]
+        else:
+            raise ValueError(f"Unknown request kind: {kind}")
+        body = json.dumps({"qr": qr_content, "device": device, "request_id": request_id}).encode()
+        requests.append((kind, "application/json", body))
+    return requests
+
+def start_server():
+    """Serve the Flask app on an ephemeral local port in a background thread"""
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    import server
+    
+    class KeepAliveHandler(WSGIRequestHandler):
+        protocol_version = "HTTP/1.1"
+        
+        def log_request(self, *args, **kwargs):
+            pass
+    
+    httpd = make_server("127.0.0.1", 0, server.app, threaded=True, request_handler=KeepAliveHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    return httpd
+
+def drive(port, requests, concurrency):
+    """Send requests from `concurrency` keep-alive clients and collect latencies"""
+    lock = threading.Lock()
+    queue = iter(requests)
+    latencies = defaultdict(list)
+    outcomes = Counter()
+    
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        while True:
+            with lock:
+                request = next(queue, None)
+            if request is None:
+                break
+            kind, content_type, body = request
+            start = time.perf_counter()
+            conn.request("POST", "/verify", body=body, headers={"Content-Type": content_type})
+            response = conn.getresponse()
+            result = json.loads(response.read())
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies[kind].append(elapsed)
+                if result.get('duplicate'):
+                    outcomes[f"{kind}:duplicate"] += 1
+                else:
+                    outcomes[f"{kind}:{'ok' if result.get('ok') else result.get('error')}"] += 1
+        conn.close()
+    
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies, outcomes
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        kind, weight = part.split('=')
+        mix[kind.strip()] = float(weight)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test /verify against a synthetic registry")
+    parser.add_argument("--items", type=int, default=10000, help="Registered items (N)")
+    parser.add_argument("--scans", type=int, default=100000, help="Pre-existing scan rows (M)")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests to send")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--mix", default="sig=80,image=5,invalid=10,unknown=5",
+                        help="Request mix weights: sig, image, invalid, unknown")
+    parser.add_argument("--compare-mode", choices=["sync", "async"], help="Override config.COMPARE_MODE")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Results JSON path (default: benchmarks/results/)")
+    args = parser.parse_args()
+    out_path = Path(args.out).resolve() if args.out else None
+    mix = parse_mix(args.mix)
+    
+    workspace = common.setup_workspace()
+    try:
+        import config
+        if args.compare_mode:
+            config.COMPARE_MODE = args.compare_mode
+        
+        print(f"Building registry: {args.items} items, {args.scans} scans")
+        image_items = 4
+        qr_contents = common.populate_registry(args.items, args.scans, image_items=image_items, seed=args.seed)
+        with open(Path("sample_data") / "qr_IMG000000.png", 'rb') as f:
+            photo = common.camera_like_photo(f.read(), seed=args.seed)
+        requests = build_requests(qr_contents, qr_contents[:image_items], photo, mix, args.requests, args.seed)
+        
+        httpd = start_server()
+        print(f"Sending {len(requests)} requests with {args.concurrency} clients")
+        elapsed, latencies, outcomes = drive(httpd.server_port, requests, args.concurrency)
+        httpd.shutdown()
+    finally:
+        common.cleanup_workspace(workspace)
+    
+    all_latencies = [ms for samples in latencies.values() for ms in samples]
+    results = {
+        "requests": len(all_latencies),
+        "seconds": round(elapsed, 3),
+        "requests_per_s": round(len(all_latencies) / elapsed, 2),
+        "latency": common.latency_stats(all_latencies),
+        "latency_by_kind": {kind: common.latency_stats(samples) for kind, samples in latencies.items()},
+        "outcomes": dict(outcomes),
+        "peak_rss_mb": common.peak_rss_mb(),
+    }
+    overall = results["latency"]
+    print(f"{results['requests_per_s']} req/s  p50 {overall['p50_ms']} ms  "
+          f"p95 {overall['p95_ms']} ms  p99 {overall['p99_ms']} ms")
+    for kind, stats in results["latency_by_kind"].items():
+        print(f"  {kind:8s} n={stats['count']:6d}  p50 {stats['p50_ms']} ms  p99 {stats['p99_ms']} ms")
+    print(f"Outcomes: {results['outcomes']}")
+    print(f"Peak RSS: {results['peak_rss_mb']}")
+    common.save_results("loadgen", vars(args), results, out_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+import hashlib
+import os
+from pathlib import Path
+import config
+
+def image_extension(data):
+    """Guess a file extension from image magic bytes"""
+    if data[:3] == b'\xff\xd8\xff':
+        return '.jpg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return '.png'
+    return '.bin'
+
+def blob_path(digest, ext):
+    """Path of a blob in the content-addressed store (fanned out by hash prefix)"""
+    return Path(config.BLOB_DIR) / digest[:2] / f"{digest}{ext}"
+
+def store_blob(data):
+    """Store bytes under their SHA-256 and return the hex digest
+    
+    Identical uploads are stored once. Writes go through a temp file and
+    rename, so a crash never leaves a partial blob under its final name.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(digest, image_extension(data))
+    if path.exists():
+        return digest
+    
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return digest
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import config
+import database
+import metrics
+import phash_index
+
+logger = logging.getLogger(__name__)
+
+class PoolBusy(Exception):
+    """Raised when the comparison queue is at its depth limit"""
+
+class PoolUnavailable(Exception):
+    """Raised when a comparison worker died; the pool is rebuilt on the next submit"""
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(config.COMPARE_QUEUE_DEPTH)
+
+def _init_worker():
+    """Import the imaging stack and build the OpenCV objects once per worker"""
+    import image_compare
+    image_compare.warm_up()
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        # Created lazily so each server process gets its own pool after startup
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=config.COMPARE_WORKERS, initializer=_init_worker)
+        return _executor
+
+def _discard_executor(executor):
+    """Drop a broken pool so the next submit starts a fresh one"""
+    global _executor
+    with _executor_lock:
+        if _executor is not executor:
+            return
+        _executor = None
+    logger.error("comparison_pool_broken rebuilding_on_next_submit")
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def _noop():
+    return None
+
+def warm_up():
+    """Start the pool's worker processes in the background and return their futures
+    
+    The server process itself never imports OpenCV/NumPy; they are
+    loaded in the pool workers, so signature-only scans skip that cost.
+    """
+    executor = _get_executor()
+    return [executor.submit(_noop) for _ in range(config.COMPARE_WORKERS)]
+
+def _compare_job(serial, signature, message, uploaded_image):
+    """Run one comparison in a worker process (features cached per worker)"""
+    import feature_store
+    import image_compare
+    canonical = feature_store.get_canonical_features(serial, signature, message)
+    return image_compare.compare_images(canonical, uploaded_image)
+
+def submit(serial, signature, message, uploaded_image):
+    """Queue an image comparison and return its future
+    
+    Raises PoolBusy instead of queueing once COMPARE_QUEUE_DEPTH
+    comparisons are already queued or running.
+    """
+    if not _slots.acquire(blocking=False):
+        raise PoolBusy(f"{config.COMPARE_QUEUE_DEPTH} image comparisons already queued")
+    
+    executor = _get_executor()
+    try:
+        future = executor.submit(_compare_job, serial, signature, message, uploaded_image)
+    except BrokenProcessPool as e:
+        _slots.release()
+        _discard_executor(executor)
+        raise PoolUnavailable(str(e))
+    except Exception:
+        _slots.release()
+        raise
+    metrics.COMPARISONS_IN_FLIGHT.inc()
+    future.add_done_callback(lambda f: _comparison_done(f, executor))
+    return future
+
+def wait_result(future, timeout):
+    """future.result(timeout), raising PoolUnavailable if the worker running it died"""
+    try:
+        return future.result(timeout=timeout)
+    except BrokenProcessPool as e:
+        raise PoolUnavailable(str(e))
+
+def _comparison_done(future, executor):
+    _slots.release()
+    metrics.COMPARISONS_IN_FLIGHT.dec()
+    if future.cancelled():
+        return
+    if isinstance(future.exception(), BrokenProcessPool):
+        _discard_executor(executor)
+    elif future.exception() is None and future.result():
+        metrics.observe_stage_ms(future.result().get('stage_ms', {}))
+
+def scan_result_values(comparison_result):
+    """Map a comparison result to (similarity, visual_flag, phash_distance, orb_ratio, phash)"""
+    if not comparison_result:
+        # No canonical image to compare against
+        return 1.0, 0, None, None, None
+    return (comparison_result['similarity'],
+            1 if comparison_result['visual_tamper'] else 0,
+            comparison_result.get('phash_distance'),
+            comparison_result.get('orb_ratio'),
+            comparison_result.get('uploaded_phash'))
+
+def _store_result(scan_id, future):
+    try:
+        values = scan_result_values(future.result())
+    except Exception as e:
+        logger.warning("async_comparison_error scan_id=%s error=%r", scan_id, e)
+        return
+    
+    try:
+        database.run_write(_update_scan, scan_id, values)
+    except Exception as e:
+        logger.error("comparison_record_error scan_id=%s error=%r", scan_id, e)
+
+def _update_scan(conn, scan_id, values):
+    conn.execute("""
+        UPDATE scans SET similarity = ?, visual_flag = ?, phash_distance = ?, orb_ratio = ?, phash = ?
+        WHERE id = ?
+    """, values + (scan_id,))
+    phash = values[4]
+    if phash:
+        serial = conn.execute("SELECT serial FROM scans WHERE id = ?", (scan_id,)).fetchone()[0]
+        phash_index.add_hash(conn, phash, serial, scan_id)
+
+def record_when_done(future, scan_id):
+    """Fill in the scan row's visual columns once the comparison completes"""
+    future.add_done_callback(lambda f: _store_result(scan_id, f))
@@ -2,23 +2,126 @@ import os
 
 # Database configuration
 DB_PATH = "db/qr_registry.db"
+DB_BUSY_TIMEOUT = 5.0        # Seconds a connection waits on a locked database
+DB_SYNCHRONOUS = "NORMAL"    # Durable across app crashes in WAL mode, fewer fsyncs than FULL
+DB_CACHE_SIZE = -16000       # Page cache per connection (negative = KiB)
+DB_MMAP_SIZE = 268435456     # Bytes of the DB file memory-mapped for reads (256 MiB)
+DB_STATEMENT_CACHE = 64      # Prepared statements kept per connection
+DB_WRITE_RETRIES = 3         # Extra attempts for writes that still hit a lock
+DB_RETRY_BACKOFF = 0.05      # Seconds before the first write retry (doubles each time)
 
 # Cryptographic keys
 KEY_PATH = "private_key.pem"
-PUBLIC_KEY_B64 = os.environ.get("PUBLIC_KEY_B64", None)
+PUBLIC_KEY_B64 = os.environ.get("PUBLIC_KEY_B64", None)  # Comma-separated; first is current
+KEYRING_PATH = "keyring.json"   # Retired public keys by key id, still accepted for verification
+KEYRING_CHECK_INTERVAL = 5.0    # Seconds between checks of key files for changes
 
 # Image comparison thresholds (adjusted for camera vs screen conditions)
 PHASH_THRESHOLD = 15  # Hamming distance threshold for pHash (higher for camera tolerance)
 SSIM_THRESHOLD = 0.3   # SSIM similarity threshold (lower for camera vs screen comparison)
+FEATURE_CACHE_SIZE = 1024  # Canonical feature records kept in memory per process
+COMPARE_IMAGE_SIZE = 128   # Side of the rectified QR region compared (whole frame if not found)
+QR_DETECT_MIN_SIZE = 400   # Small images are upscaled to this before QR detection
+SIMILARITY_SIZE = int(os.environ.get("QR_SIMILARITY_SIZE", 0)) or COMPARE_IMAGE_SIZE  # Side SSIM runs at (check with bench_similarity)
+SIMILARITY_CHUNK = 8       # Images per vectorized pHash/SSIM pass (sized to stay in cache)
+
+# Staged visual tamper decision (pHash first, SSIM and ORB only when ambiguous).
+# Tuned on rectified COMPARE_IMAGE_SIZE crops with bench_similarity's labeled set;
+# re-check FAR/FRR there after changing them or the preprocessing.
+VISUAL_PHASH_ACCEPT = 6      # pHash distance accepted as genuine without SSIM/ORB
+VISUAL_PHASH_MAX = 16        # Rule 1: pHash distance at most this...
+VISUAL_SSIM_MIN = 0.85       # ...and SSIM at least this
+VISUAL_PHASH_TOLERANT = 18   # Rule 2: pHash distance at most this (beyond it: tampered)...
+VISUAL_SSIM_TOLERANT = 0.0   # ...SSIM at least this (below it: tampered; low SSIM alone is a slightly off crop)...
+VISUAL_ORB_MIN = 0.64        # ...and ORB match ratio at least this
+
+# Image comparison worker pool
+COMPARE_WORKERS = int(os.environ.get("QR_COMPARE_WORKERS", 0)) or os.cpu_count()  # Per server process
+CV_THREADS = int(os.environ.get("QR_CV_THREADS", 1))  # OpenCV threads per process (pool gives the parallelism)
+COMPARE_QUEUE_DEPTH = 32  # Max comparisons queued or running before new ones are skipped
+COMPARE_MODE = "sync"     # "sync": wait up to COMPARE_TIMEOUT, "async": fill scan row later
+COMPARE_TIMEOUT = 5.0     # Seconds a sync-mode request waits before going async
 
 # Behavioral analysis thresholds
-SCAN_FLAG_THRESHOLD = 10  # Flag items scanned more than this many times
+SCAN_FLAG_THRESHOLD = 10  # Admin "high scan count" panel: items scanned more than this many times
+
+# /verify idempotency window (idempotency.py)
+VERIFY_DEDUP_TTL = 5.0             # Seconds a (qr, device, request id) result is replayed; 0 disables
+VERIFY_DEDUP_MAX_ENTRIES = 10000   # Results kept per process
+
+# Streaming anomaly engine (anomaly.py), flags returned by /verify
+ANOMALY_RATE_WINDOW = 3600.0        # Seconds; time constant of the decayed scan rate
+ANOMALY_BURST_SCANS = 10            # Flag scan_burst above this many scans per window
+ANOMALY_MAX_DEVICES = 5             # Flag device_spread above this many distinct devices
+ANOMALY_MAX_SPEED_KMH = 900.0       # Flag impossible_travel between geo fixes faster than this
+ANOMALY_MIN_TRAVEL_KM = 50.0        # Ignore geo jumps shorter than this (GPS noise)
+
+# Registry lookup cache (serial_cache.py)
+SERIAL_CACHE_SIZE = 100000           # Hot items' verify columns kept per process (LRU)
+SERIAL_BLOOM_ERROR_RATE = 0.001      # Bloom filter false-positive rate (unknown serials reaching the DB)
+SERIAL_BLOOM_MIN_CAPACITY = 1000000  # Filter is sized for max(this, 2x registered serials)
+SERIAL_CACHE_CHECK_INTERVAL = 1.0    # Seconds between registry_version checks (new serials visible after this)
 
 # QR code generation settings
+QR_PAYLOAD_VERSION = 2  # 2: compact binary + base45 payload, 1: base64url JSON (still verified)
 QR_BOX_SIZE = 2  # Pixels per QR box (configurable for ~1cm print size)
 QR_BORDER = 1    # Border size in boxes
 
+# Print sheets (generator.py --export-sheets)
+SHEET_DPI = 300               # Output resolution
+SHEET_PAGE_MM = (210, 297)    # Page size (A4)
+SHEET_MARGIN_MM = 10          # Page margin
+SHEET_CELL_MM = 14            # Grid pitch per code, including the serial caption
+SHEET_CODE_MM = 10            # Target printed code width (whole pixels per module)
+SHEET_PDF_PAGES = 200         # Pages per PDF file
+
+# Bulk generation settings (generator.py --create-batch)
+BATCH_COMMIT_SIZE = 5000  # Items inserted per transaction
+BATCH_CHUNK_SIZE = 64     # Rows handed to a worker process at a time
+
+# Scan image uploads
+MAX_UPLOAD_BYTES = 4 * 1024 * 1024  # Largest accepted /verify request body
+STORE_SCAN_IMAGES = False  # Keep uploaded frames in the content-addressed blob store
+SCAN_META_MAX_VALUE = 1024  # Longer string values in client meta are dropped from scans.meta
+BLOB_DIR = "blobs"         # Blob store root (files fanned out by SHA-256 prefix)
+
+# pHash similarity index for cloned labels across serials
+PHASH_INDEX_CHUNKS = 4          # 16-bit chunks per 64-bit pHash (multi-index hashing)
+PHASH_INDEX_MAX_DISTANCE = 11   # Largest Hamming distance a query may ask for
+PHASH_CLONE_DISTANCE = 6        # Default distance for /admin/phash lookups
+
+# Offline edge verification (registry_snapshot.py, edge_verify.py)
+EDGE_SNAPSHOT_PATH = "registry.snap"        # Registry snapshot read by edge verifiers
+EDGE_JOURNAL_PATH = "edge_journal.jsonl"    # Append-only journal of scans verified offline
+EDGE_UPLOAD_BATCH = 500                     # Journal entries per /verify/import request (<= VERIFY_BATCH_MAX)
+IMPORT_MAX_CLOCK_SKEW = 300                 # Seconds an imported scan's ts may be ahead of the server clock
+
+# Batch verification (/verify/batch)
+VERIFY_BATCH_MAX = 1000   # Max QR codes per request
+VERIFY_BATCH_CHUNK = 256  # Serials per IN (...) lookup
+
+# Scan retention (archive_scans.py)
+SCAN_RETENTION_DAYS = 90     # Raw scans kept in the live table
+ARCHIVE_DIR = "archive"      # Monthly gzip JSON-lines archives of older scans
+ARCHIVE_DELETE_CHUNK = 5000  # Archived scans deleted per transaction
+
+# Admin API
+ADMIN_PAGE_SIZE = 50    # Scans per page by default
+ADMIN_PAGE_MAX = 500    # Largest page a client may request
+ADMIN_CACHE_TTL = 5.0   # Seconds aggregate panels are served from cache
+
+# Logging and metrics (/metrics)
+LOG_LEVEL = os.environ.get("QR_LOG_LEVEL", "INFO")  # DEBUG logs per-comparison details
+COMPARE_LOG_SAMPLE_RATE = float(os.environ.get("QR_COMPARE_LOG_SAMPLE_RATE", 0.1))  # Fraction of comparisons logged at DEBUG
+
 # Server configuration
 FLASK_HOST = "0.0.0.0"
 FLASK_PORT = 5000
-DEBUG = True
\ No newline at end of file
+DEBUG = os.environ.get("QR_DEBUG", "1") == "1"  # Dev server only (python server.py)
+
+# Production serving (gunicorn -c gunicorn.conf.py wsgi:app)
+WEB_WORKERS = int(os.environ.get("QR_WEB_WORKERS", 0)) or max(2, os.cpu_count() // 2)
+WEB_THREADS = int(os.environ.get("QR_WEB_THREADS", 4))       # Request threads per worker
+WEB_TIMEOUT = int(os.environ.get("QR_WEB_TIMEOUT", 30))      # Seconds before a stuck worker is restarted
+WEB_GRACEFUL_TIMEOUT = int(os.environ.get("QR_WEB_GRACEFUL_TIMEOUT", 30))  # Seconds to finish requests on reload
+WEB_MAX_REQUESTS = int(os.environ.get("QR_WEB_MAX_REQUESTS", 0))  # Recycle workers after N requests (0: never)
\ No newline at end of file
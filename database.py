@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import os
+import sqlite3
+import threading
+import time
+import config
+
+_local = threading.local()
+
+def _open_connection():
+    """Open a tuned connection to the registry database"""
+    conn = sqlite3.connect(
+        config.DB_PATH,
+        timeout=config.DB_BUSY_TIMEOUT,
+        cached_statements=config.DB_STATEMENT_CACHE,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={config.DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size={config.DB_CACHE_SIZE}")
+    conn.execute(f"PRAGMA mmap_size={config.DB_MMAP_SIZE}")
+    return conn
+
+def get_connection():
+    """Get this thread's pooled connection, opening it on first use
+    
+    Connections are kept per thread and per process, so a connection
+    opened before a fork is never shared with the child. Statements are
+    prepared once per connection and reused through sqlite3's statement
+    cache, so callers should use constant SQL strings with parameters.
+    Pooling only pays off when threads are reused (gunicorn gthread
+    workers); the Werkzeug dev server runs each request on a new thread,
+    which opens a new connection (see benchmarks/bench_db.py).
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid() or _local.path != config.DB_PATH:
+        conn = _open_connection()
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.path = config.DB_PATH
+    return conn
+
+def close_connection():
+    """Close this thread's pooled connection, if any"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
+def run_write(fn, *args):
+    """Run fn(conn, *args) in a transaction and return its result
+    
+    Commits on success and rolls back on error. Lock errors that outlast
+    the busy timeout are retried DB_WRITE_RETRIES times with backoff.
+    """
+    conn = get_connection()
+    for attempt in range(config.DB_WRITE_RETRIES + 1):
+        try:
+            with conn:
+                return fn(conn, *args)
+        except sqlite3.OperationalError as e:
+            message = str(e)
+            if ('locked' not in message and 'busy' not in message) or attempt == config.DB_WRITE_RETRIES:
+                raise
+            time.sleep(config.DB_RETRY_BACKOFF * (2 ** attempt))
@@ -6,7 +6,7 @@ CREATE TABLE IF NOT EXISTS items (
     nonce TEXT NOT NULL,
     message TEXT NOT NULL,
     signature TEXT NOT NULL,
-    qr_path TEXT NOT NULL,
+    qr_path TEXT NOT NULL,  -- Legacy; canonical images are rendered from message/signature
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -20,8 +20,148 @@ CREATE TABLE IF NOT EXISTS scans (
     visual_flag INTEGER DEFAULT 0,
     phash_distance INTEGER,
     orb_ratio REAL,
+    phash TEXT,
     FOREIGN KEY (serial) REFERENCES items (serial)
 );
 
-CREATE INDEX IF NOT EXISTS idx_scans_serial ON scans(serial);
-CREATE INDEX IF NOT EXISTS idx_scans_ts ON scans(ts);
\ No newline at end of file
+CREATE TABLE IF NOT EXISTS canonical_features (
+    serial TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    signature TEXT NOT NULL,
+    phash TEXT NOT NULL,
+    processed BLOB NOT NULL,
+    descriptors BLOB,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (serial) REFERENCES items (serial)
+);
+
+-- All-time per-serial scan counters, maintained by the triggers below in the
+-- same transaction as each scan insert (not decremented when scans are archived)
+CREATE TABLE IF NOT EXISTS scan_stats (
+    serial TEXT PRIMARY KEY,
+    scan_count INTEGER NOT NULL DEFAULT 0,
+    first_ts DATETIME,
+    last_ts DATETIME,
+    visual_flag_count INTEGER NOT NULL DEFAULT 0,
+    distinct_devices INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS scan_devices (
+    serial TEXT NOT NULL,
+    device TEXT NOT NULL,
+    PRIMARY KEY (serial, device)
+) WITHOUT ROWID;
+
+-- Checkpointed state of the streaming anomaly engine (see anomaly.py)
+CREATE TABLE IF NOT EXISTS anomaly_state (
+    serial TEXT PRIMARY KEY,
+    rate REAL NOT NULL,
+    updated REAL,
+    devices BLOB NOT NULL,
+    lat REAL,
+    lon REAL,
+    geo_ts REAL,
+    flags TEXT NOT NULL DEFAULT ''
+);
+
+-- Per-serial aggregates of archived scans (see archive_scans.py)
+CREATE TABLE IF NOT EXISTS scan_rollups_hourly (
+    serial TEXT NOT NULL,
+    hour DATETIME NOT NULL,
+    scans INTEGER NOT NULL,
+    visual_flags INTEGER NOT NULL,
+    devices INTEGER NOT NULL,
+    PRIMARY KEY (serial, hour)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS scan_rollups_daily (
+    serial TEXT NOT NULL,
+    day DATE NOT NULL,
+    scans INTEGER NOT NULL,
+    visual_flags INTEGER NOT NULL,
+    devices INTEGER NOT NULL,
+    PRIMARY KEY (serial, day)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS scan_archive_log (
+    day DATE PRIMARY KEY,
+    state TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    archive_file TEXT NOT NULL,
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    max_id INTEGER NOT NULL DEFAULT 0,  -- Current pass covers the day's scans up to this id
+    archive_offset INTEGER  -- Archive size before the current pass appended to it
+);
+
+-- Multi-index hashing over canonical and scan pHashes (see phash_index.py);
+-- scan_id 0 is the serial's canonical image
+CREATE TABLE IF NOT EXISTS phash_index (
+    serial TEXT NOT NULL,
+    scan_id INTEGER NOT NULL,
+    phash TEXT NOT NULL,
+    c0 INTEGER NOT NULL,
+    c1 INTEGER NOT NULL,
+    c2 INTEGER NOT NULL,
+    c3 INTEGER NOT NULL,
+    PRIMARY KEY (serial, scan_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_phash_c0 ON phash_index(c0);
+CREATE INDEX IF NOT EXISTS idx_phash_c1 ON phash_index(c1);
+CREATE INDEX IF NOT EXISTS idx_phash_c2 ON phash_index(c2);
+CREATE INDEX IF NOT EXISTS idx_phash_c3 ON phash_index(c3);
+
+CREATE INDEX IF NOT EXISTS idx_scan_stats_count ON scan_stats(scan_count);
+
+CREATE TRIGGER IF NOT EXISTS trg_scans_insert_stats AFTER INSERT ON scans
+BEGIN
+    INSERT OR IGNORE INTO scan_stats (serial, first_ts, last_ts) VALUES (NEW.serial, NEW.ts, NEW.ts);
+    UPDATE scan_stats SET
+        scan_count = scan_count + 1,
+        -- Imported scans keep their original ts, so they can predate the stored bounds
+        first_ts = MIN(IFNULL(first_ts, NEW.ts), NEW.ts),
+        last_ts = MAX(IFNULL(last_ts, NEW.ts), NEW.ts),
+        visual_flag_count = visual_flag_count + (IFNULL(NEW.visual_flag, 0) = 1),
+        distinct_devices = distinct_devices + (NOT EXISTS (
+            SELECT 1 FROM scan_devices WHERE serial = NEW.serial AND device = IFNULL(NEW.device, '')
+        ))
+    WHERE serial = NEW.serial;
+    INSERT OR IGNORE INTO scan_devices (serial, device) VALUES (NEW.serial, IFNULL(NEW.device, ''));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_scans_visual_flag_stats AFTER UPDATE OF visual_flag ON scans
+WHEN IFNULL(NEW.visual_flag, 0) != IFNULL(OLD.visual_flag, 0)
+BEGIN
+    UPDATE scan_stats SET
+        visual_flag_count = visual_flag_count + (IFNULL(NEW.visual_flag, 0) = 1) - (IFNULL(OLD.visual_flag, 0) = 1)
+    WHERE serial = NEW.serial;
+END;
+
+-- Admin listing filters; each index also carries the rowid (id), so ORDER BY ts, id needs no sort
+CREATE INDEX IF NOT EXISTS idx_scans_ts ON scans(ts);
+CREATE INDEX IF NOT EXISTS idx_scans_serial_ts ON scans(serial, ts);
+CREATE INDEX IF NOT EXISTS idx_scans_device_ts ON scans(device, ts);
+CREATE INDEX IF NOT EXISTS idx_scans_visual_ts ON scans(visual_flag, ts);
+CREATE INDEX IF NOT EXISTS idx_items_batch ON items(batch);
+
+-- Bumped on every items write so verify processes know to refresh their serial cache
+CREATE TABLE IF NOT EXISTS registry_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO registry_version (id, version) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_items_insert_version AFTER INSERT ON items
+BEGIN
+    UPDATE registry_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_items_update_version AFTER UPDATE ON items
+BEGIN
+    UPDATE registry_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_items_delete_version AFTER DELETE ON items
+BEGIN
+    UPDATE registry_version SET version = version + 1 WHERE id = 1;
+END;
\ No newline at end of file
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.request
+import config
+from qr_verify import QRError, check_qr_content
+from registry_snapshot import RegistrySnapshot
+
+# Offline verification for sites without a reliable link to the server.
+# QR strings are checked against a registry snapshot (registry_snapshot.py)
+# with the same decoding and signature checks as /verify. Accepted scans are
+# appended to a local journal and uploaded later to /verify/import. The byte
+# offset already uploaded is kept in JOURNAL.offset, so the journal itself is
+# never rewritten. Delivery is at-least-once: if the process dies between a
+# successful upload and saving the offset, the next upload repeats that
+# batch.
+
+class EdgeVerifier:
+    """Verify QR strings against a registry snapshot and journal accepted scans"""
+    
+    def __init__(self, snapshot_path=None, journal_path=None):
+        self.snapshot = RegistrySnapshot(snapshot_path)
+        self.journal_path = journal_path or config.EDGE_JOURNAL_PATH
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+    
+    def verify(self, qr_content, device='edge', meta=None):
+        """Verify one scan and return a /verify-style response dict"""
+        try:
+            payload, serial = check_qr_content(qr_content, self.snapshot.keyring)
+        except QRError as e:
+            return e.response()
+        
+        item = self.snapshot.lookup(serial)
+        if item is None:
+            return {"ok": False, "error": "unknown_serial", "detail": f"Serial {serial} not found"}
+        payload.setdefault('p', item[0])
+        payload.setdefault('b', item[1])
+        
+        entry = {"qr": qr_content, "device": device, "ts": time.time(), "meta": meta or {}}
+        self._journal.write(json.dumps(entry, separators=(',', ':')) + "\n")
+        self._journal.flush()
+        return {"ok": True, "serial": serial, "payload": payload, "offline": True}
+    
+    def close(self):
+        self._journal.close()
+        self.snapshot.close()
+
+def _read_offset(journal_path):
+    try:
+        with open(f"{journal_path}.offset") as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+def _write_offset(journal_path, offset):
+    tmp_path = f"{journal_path}.offset.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(str(offset))
+    os.replace(tmp_path, f"{journal_path}.offset")
+
+def _post_scans(url, scans):
+    request = urllib.request.Request(url, data=json.dumps({"scans": scans}).encode(),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.load(response)
+
+def upload_journal(server_url, journal_path=None):
+    """Send journal entries not yet uploaded to SERVER/verify/import and return how many were sent"""
+    journal_path = journal_path or config.EDGE_JOURNAL_PATH
+    url = server_url.rstrip('/') + "/verify/import"
+    offset = _read_offset(journal_path)
+    
+    sent = 0
+    with open(journal_path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            scans = []
+            end = offset
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Partial line still being written
+                end += len(line)
+                scans.append(json.loads(line))
+                if len(scans) >= config.EDGE_UPLOAD_BATCH:
+                    break
+            if not scans:
+                return sent
+            
+            result = _post_scans(url, scans)
+            if not result.get('ok'):
+                raise RuntimeError(f"Upload rejected: {result.get('error')} {result.get('detail', '')}")
+            offset = end
+            _write_offset(journal_path, offset)
+            sent += len(scans)
+            print(f"  {sent} scan(s) uploaded ({result.get('imported')} recorded)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline QR verifier backed by a registry snapshot")
+    parser.add_argument("qrs", nargs="*", help="QR strings to verify ('-' reads one per line from stdin)")
+    parser.add_argument("--snapshot", default=config.EDGE_SNAPSHOT_PATH,
+                        help=f"Registry snapshot (default: {config.EDGE_SNAPSHOT_PATH})")
+    parser.add_argument("--journal", default=config.EDGE_JOURNAL_PATH,
+                        help=f"Scan journal (default: {config.EDGE_JOURNAL_PATH})")
+    parser.add_argument("--device", default="edge", help="Device name recorded with each scan")
+    parser.add_argument("--upload", metavar="SERVER_URL",
+                        help="Upload journaled scans to SERVER_URL/verify/import and exit")
+    args = parser.parse_args()
+    
+    if args.upload:
+        sent = upload_journal(args.upload, args.journal)
+        print(f"Upload complete: {sent} scan(s)")
+        return
+    
+    qrs = args.qrs
+    if qrs == ['-']:
+        qrs = (line.strip() for line in sys.stdin if line.strip())
+    
+    verifier = EdgeVerifier(args.snapshot, args.journal)
+    try:
+        for qr_content in qrs:
+            print(json.dumps(verifier.verify(qr_content, args.device)))
+    finally:
+        verifier.close()
+
+if __name__ == "__main__":
+    main()
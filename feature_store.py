@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+import sqlite3
+from functools import lru_cache
+import numpy as np
+import cv2
+import config
+import database
+import image_compare
+import phash_index
+import qr_render
+
+# Bump when preprocessing or feature extraction changes so stale rows are recomputed
+FEATURE_VERSION = 3
+
+def serialize_features(features):
+    """Convert a features dict into (phash, processed, descriptors) column values"""
+    ok, processed_png = cv2.imencode('.png', features['processed'])
+    if not ok:
+        raise ValueError("Failed to encode preprocessed image")
+    
+    descriptors = features['descriptors']
+    descriptors_blob = descriptors.tobytes() if descriptors is not None else None
+    return features['phash'], processed_png.tobytes(), descriptors_blob
+
+def deserialize_features(phash, processed_blob, descriptors_blob):
+    """Rebuild a features dict from stored column values"""
+    processed = cv2.imdecode(np.frombuffer(processed_blob, np.uint8), cv2.IMREAD_GRAYSCALE)
+    processed.flags.writeable = False
+    
+    descriptors = None
+    if descriptors_blob:
+        # ORB descriptors are 32-byte rows
+        descriptors = np.frombuffer(descriptors_blob, np.uint8).reshape(-1, 32)
+    
+    return {
+        'processed': processed,
+        'phash': phash,
+        'descriptors': descriptors
+    }
+
+def feature_row(serial, signature, features):
+    """Build a canonical_features row tuple (picklable, for bulk inserts)"""
+    phash, processed_blob, descriptors_blob = serialize_features(features)
+    return (serial, FEATURE_VERSION, signature, phash, processed_blob, descriptors_blob)
+
+def save_feature_rows(conn, rows):
+    """Store many canonical_features row tuples and index their pHashes (caller commits)"""
+    conn.executemany("""
+        INSERT OR REPLACE INTO canonical_features
+        (serial, version, signature, phash, processed, descriptors)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, rows)
+    phash_index.add_hashes(conn, [(row[3], row[0], 0) for row in rows])
+
+def save_features(conn, serial, signature, features):
+    """Store canonical features for a serial (caller commits)"""
+    save_feature_rows(conn, [feature_row(serial, signature, features)])
+
+def load_features(conn, serial, signature):
+    """Load stored canonical features, or None if missing or stale"""
+    row = conn.execute("""
+        SELECT phash, processed, descriptors FROM canonical_features
+        WHERE serial = ? AND signature = ? AND version = ?
+    """, (serial, signature, FEATURE_VERSION)).fetchone()
+    
+    if not row:
+        return None
+    return deserialize_features(*row)
+
+@lru_cache(maxsize=config.FEATURE_CACHE_SIZE)
+def _cached_features(serial, signature, message):
+    conn = database.get_connection()
+    features = load_features(conn, serial, signature)
+    if features is None:
+        # Missing or stale: re-render the canonical image, compute once and persist
+        png_data = qr_render.render_item_png(message, signature)
+        features = image_compare.extract_features(png_data)
+        database.run_write(save_features, serial, signature, features)
+    return features
+
+def get_canonical_features(serial, signature, message):
+    """Get canonical features for an item via the in-process LRU cache
+    
+    The signature is part of the cache key, so re-creating an item with
+    the same serial never serves stale features. Items without stored
+    features are rendered from their message and signature.
+    """
+    return _cached_features(serial, signature, message)
+
+def backfill_features():
+    """Compute features for items that have none stored yet"""
+    conn = sqlite3.connect(config.DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute("""
+        SELECT i.serial, i.signature, i.message FROM items i
+        LEFT JOIN canonical_features f
+            ON f.serial = i.serial AND f.signature = i.signature AND f.version = ?
+        WHERE f.serial IS NULL
+    """, (FEATURE_VERSION,))
+    missing = cursor.fetchall()
+    
+    computed = 0
+    for serial, signature, message in missing:
+        features = image_compare.extract_features(qr_render.render_item_png(message, signature))
+        save_features(conn, serial, signature, features)
+        computed += 1
+    
+    conn.commit()
+    conn.close()
+    print(f"Canonical features computed for {computed} item(s)")
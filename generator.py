@@ -1,18 +1,32 @@
 #!/usr/bin/env python3
 import argparse
-import json
+import csv
+import sys
+import time
 import sqlite3
 import base64
 import secrets
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
-import qrcode
 from nacl.signing import SigningKey
 from nacl.encoding import Base64Encoder
 import config
+import image_compare
+import feature_store
+import qr_payload
+import qr_render
+import serial_cache
+import signing_keys
 
 def generate_keys():
     """Generate Ed25519 key pair and save private key"""
+    # Keep the outgoing key verifiable so already-printed labels stay valid
+    if Path(config.KEY_PATH).exists():
+        old_key = load_signing_key().verify_key
+        signing_keys.retire_key(old_key)
+        print(f"Previous key {signing_keys.key_id(old_key)} retired to: {config.KEYRING_PATH}")
+    
     signing_key = SigningKey.generate()
     
     # Save private key
@@ -24,6 +38,7 @@ def generate_keys():
     print(f"Keys generated successfully!")
     print(f"Private key saved to: {config.KEY_PATH}")
     print(f"Public key (base64url): {public_key_b64}")
+    print(f"Key id: {signing_keys.key_id(signing_key.verify_key)}")
     return public_key_b64
 
 def init_database():
@@ -46,44 +61,56 @@ def load_signing_key():
     with open(config.KEY_PATH, 'rb') as f:
         return SigningKey(f.read())
 
-def create_qr_item(product, serial, batch):
-    """Create signed QR code item"""
-    # Generate payload
-    payload = {
-        "v": 1,
-        "p": product,
-        "s": serial,
-        "b": batch,
-        "m": datetime.now().strftime("%Y-%m-%d"),
-        "r": base64.urlsafe_b64encode(secrets.token_bytes(16)).decode().rstrip('=')
-    }
+def sign_payload(product, serial, batch, signing_key, version=None):
+    """Build and sign a QR payload, returning (payload, message_b64, signature_b64, qr_content)"""
+    version = version or config.QR_PAYLOAD_VERSION
+    kid = signing_keys.key_id(signing_key.verify_key)
+    mfg = datetime.now().strftime("%Y-%m-%d")
     
     # Encode message
-    message_json = json.dumps(payload, separators=(',', ':'))
-    message_bytes = message_json.encode('utf-8')
-    message_b64 = base64.urlsafe_b64encode(message_bytes).decode().rstrip('=')
+    if version == 2:
+        # Compact binary layout; product/batch live only in the registry
+        nonce = secrets.token_bytes(qr_payload.V2_NONCE_BYTES)
+        message_bytes = qr_payload.pack_v2(serial, mfg, nonce, kid)
+        payload = qr_payload.unpack_v2(message_bytes)
+    else:
+        payload = {
+            "v": 1,
+            "kid": kid,
+            "p": product,
+            "s": serial,
+            "b": batch,
+            "m": mfg,
+            "r": qr_payload.b64url_encode(secrets.token_bytes(16))
+        }
+        message_bytes = qr_payload.pack_v1(payload)
     
     # Sign message
-    signing_key = load_signing_key()
     signature = signing_key.sign(message_bytes).signature
-    signature_b64 = base64.urlsafe_b64encode(signature).decode().rstrip('=')
     
-    # Create QR content
-    qr_content = f"{message_b64}.{signature_b64}"
+    message_b64 = qr_payload.b64url_encode(message_bytes)
+    signature_b64 = qr_payload.b64url_encode(signature)
+    qr_content = qr_payload.encode_qr_content(message_bytes, signature)
+    return payload, message_b64, signature_b64, qr_content
+
+def write_png(png_data, png_path):
+    """Write PNG bytes to a file, creating its directory"""
+    Path(png_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(png_path, 'wb') as f:
+        f.write(png_data)
+
+def create_qr_item(product, serial, batch, png_path=None):
+    """Create signed QR code item, optionally writing its PNG to png_path"""
+    signing_key = load_signing_key()
+    payload, message_b64, signature_b64, qr_content = sign_payload(product, serial, batch, signing_key)
     
-    # Generate QR code PNG
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=config.QR_BOX_SIZE,
-        border=config.QR_BORDER,
-    )
-    qr.add_data(qr_content)
-    qr.make(fit=True)
+    # The canonical image is rendered in memory; items no longer keep a file path
+    png_data = qr_render.render_qr_png(qr_content)
+    if png_path:
+        write_png(png_data, png_path)
     
-    img = qr.make_image(fill_color="black", back_color="white")
-    qr_path = f"sample_data/qr_{serial}.png"
-    img.save(qr_path)
+    # Precompute canonical features so verification skips the canonical image work
+    features = image_compare.extract_features(png_data)
     
     # Store in database
     conn = sqlite3.connect(config.DB_PATH)
@@ -92,14 +119,137 @@ def create_qr_item(product, serial, batch):
         (serial, product, batch, mfg, nonce, message, signature, qr_path)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?)
     """, (serial, product, batch, payload["m"], payload["r"], 
-          message_b64, signature_b64, qr_path))
+          message_b64, signature_b64, ""))
+    feature_store.save_features(conn, serial, signature_b64, features)
     conn.commit()
     conn.close()
+    # Other processes pick the item up through registry_version
+    serial_cache.get_cache().invalidate()
     
-    print(f"QR code created: {qr_path}")
+    if png_path:
+        print(f"QR code created: {png_path}")
     print(f"Serial: {serial}")
     print(f"QR content: {qr_content[:50]}...")
-    return qr_path
+    return qr_content
+
+def render_item(serial, png_path=None):
+    """Write a registered item's QR PNG (re-rendered from the registry) and return the path"""
+    conn = sqlite3.connect(config.DB_PATH)
+    row = conn.execute("SELECT message, signature FROM items WHERE serial = ?", (serial,)).fetchone()
+    conn.close()
+    if not row:
+        raise KeyError(f"Serial {serial} not found")
+    
+    png_path = png_path or f"sample_data/qr_{serial}.png"
+    write_png(qr_render.render_item_png(*row), png_path)
+    print(f"QR code rendered: {png_path}")
+    return png_path
+
+def read_batch_rows(source):
+    """Read (product, serial, batch) rows from a CSV file or '-' for stdin"""
+    handle = sys.stdin if source == '-' else open(source, newline='')
+    try:
+        seen = set()
+        for row in csv.reader(handle):
+            if not row or row[0].startswith('#'):
+                continue
+            if len(row) < 3:
+                raise ValueError(f"Expected product,serial,batch but got: {row}")
+            
+            product, serial, batch = (field.strip() for field in row[:3])
+            if (product, serial, batch) == ("product", "serial", "batch"):
+                continue  # Header row
+            
+            # Duplicate serials would overwrite each other's PNG
+            if serial in seen:
+                print(f"Skipping duplicate serial in input: {serial}")
+                continue
+            seen.add(serial)
+            yield product, serial, batch
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+# Signing key for batch worker processes, loaded once per worker
+_batch_signing_key = None
+
+def _init_batch_worker():
+    global _batch_signing_key
+    _batch_signing_key = load_signing_key()
+
+def _build_batch_item(row):
+    """Sign, render and extract features for one batch row (runs in a worker)"""
+    product, serial, batch = row
+    payload, message_b64, signature_b64, qr_content = sign_payload(product, serial, batch, _batch_signing_key)
+    
+    # Rendered in memory only; print files come from --export-sheets
+    png_data = qr_render.render_qr_png(qr_content)
+    features = image_compare.extract_features(png_data)
+    
+    item_row = (serial, product, batch, payload["m"], payload["r"],
+                message_b64, signature_b64, "")
+    return item_row, feature_store.feature_row(serial, signature_b64, features)
+
+def _insert_batch(conn, item_rows, feature_rows):
+    conn.executemany("""
+        INSERT OR IGNORE INTO items 
+        (serial, product, batch, mfg, nonce, message, signature, qr_path)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, item_rows)
+    feature_store.save_feature_rows(conn, feature_rows)
+    conn.commit()
+    serial_cache.get_cache().invalidate()
+
+def create_qr_batch(source, workers=None):
+    """Create items in bulk from CSV rows, skipping serials already in the registry"""
+    # Fail fast before spawning workers
+    load_signing_key()
+    
+    conn = sqlite3.connect(config.DB_PATH)
+    existing = {row[0] for row in conn.execute("SELECT serial FROM items")}
+    
+    rows = []
+    skipped = 0
+    for row in read_batch_rows(source):
+        if row[1] in existing:
+            skipped += 1
+        else:
+            rows.append(row)
+    
+    total = len(rows)
+    print(f"Batch: {total} item(s) to create, {skipped} already present")
+    if not rows:
+        conn.close()
+        return 0
+    
+    created = 0
+    item_rows = []
+    feature_rows = []
+    started = time.perf_counter()
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker) as executor:
+        results = executor.map(_build_batch_item, rows, chunksize=config.BATCH_CHUNK_SIZE)
+        for item_row, feature_row in results:
+            item_rows.append(item_row)
+            feature_rows.append(feature_row)
+            
+            if len(item_rows) >= config.BATCH_COMMIT_SIZE:
+                _insert_batch(conn, item_rows, feature_rows)
+                created += len(item_rows)
+                item_rows, feature_rows = [], []
+                
+                elapsed = time.perf_counter() - started
+                print(f"  {created}/{total} items ({created / elapsed:.1f} items/s)")
+    
+    if item_rows:
+        _insert_batch(conn, item_rows, feature_rows)
+        created += len(item_rows)
+    conn.close()
+    
+    elapsed = time.perf_counter() - started
+    print(f"Batch complete: {created} item(s) in {elapsed:.1f}s "
+          f"({created / max(elapsed, 1e-9):.1f} items/s)")
+    return created
 
 def main():
     parser = argparse.ArgumentParser(description="Anti-counterfeit QR generator")
@@ -107,6 +257,18 @@ def main():
     parser.add_argument("--init-db", action="store_true", help="Initialize database")
     parser.add_argument("--create", nargs=3, metavar=("PRODUCT", "SERIAL", "BATCH"), 
                        help="Create signed QR code")
+    parser.add_argument("--create-batch", metavar="CSV",
+                       help="Create items from product,serial,batch CSV rows ('-' for stdin)")
+    parser.add_argument("--workers", type=int, default=None,
+                       help="Worker processes for --create-batch (default: CPU count)")
+    parser.add_argument("--render", metavar="SERIAL",
+                       help="Write a registered item's QR PNG (default: sample_data/qr_SERIAL.png)")
+    parser.add_argument("--export-sheets", metavar="OUT_DIR",
+                       help="Tile registered codes into print sheets")
+    parser.add_argument("--batch", help="With --export-sheets: only this batch")
+    parser.add_argument("--format", choices=("pdf", "png"), default="pdf",
+                       help="With --export-sheets: PDF files or one PNG per sheet (default: pdf)")
+    parser.add_argument("-o", "--output", help="With --create/--render: PNG path")
     
     args = parser.parse_args()
     
@@ -116,7 +278,14 @@ def main():
         init_database()
     elif args.create:
         product, serial, batch = args.create
-        create_qr_item(product, serial, batch)
+        create_qr_item(product, serial, batch, args.output or f"sample_data/qr_{serial}.png")
+    elif args.create_batch:
+        create_qr_batch(args.create_batch, args.workers)
+    elif args.render:
+        render_item(args.render, args.output)
+    elif args.export_sheets:
+        pages = qr_render.export_sheets(args.export_sheets, args.batch, args.format)
+        print(f"Exported {pages} sheet(s) to {args.export_sheets}")
     else:
         parser.print_help()
 
@@ -0,0 +1,33 @@
+# gunicorn settings for production serving: gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Graceful reload: `kill -HUP <master pid>` starts fresh workers and lets the
+# old ones finish in-flight requests. Because the app is preloaded, code
+# changes need a full restart (or USR2 + QUIT for a zero-downtime upgrade).
+import os
+import config
+
+bind = f"{config.FLASK_HOST}:{config.FLASK_PORT}"
+workers = config.WEB_WORKERS
+worker_class = "gthread"
+threads = config.WEB_THREADS
+preload_app = True
+timeout = config.WEB_TIMEOUT
+graceful_timeout = config.WEB_GRACEFUL_TIMEOUT
+max_requests = config.WEB_MAX_REQUESTS
+max_requests_jitter = config.WEB_MAX_REQUESTS // 10
+limit_request_line = 8190
+accesslog = "-"
+
+# Each worker gets its own comparison pool; split the cores between them
+# unless QR_COMPARE_WORKERS pins the size
+if not os.environ.get("QR_COMPARE_WORKERS"):
+    config.COMPARE_WORKERS = max(1, os.cpu_count() // workers)
+
+def post_fork(server, worker):
+    # Never reuse a DB connection the master opened while preloading
+    import database
+    database.close_connection()
+    
+    # Fork this worker's comparison processes now rather than on the first image scan
+    import compare_pool
+    compare_pool.warm_up()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+import threading
+import time
+from collections import OrderedDict
+import config
+
+# The camera page keeps posting while a label stays in view, so one physical
+# scan arrives as a burst of identical /verify requests. Results are kept for
+# VERIFY_DEDUP_TTL seconds per key, and concurrent requests with the same key
+# wait for the first one instead of verifying (and recording) it again.
+# Per process: under gunicorn, repeats that land on another worker are not
+# coalesced.
+
+class _Flight:
+    __slots__ = ('done', 'result')
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+class IdempotencyCache:
+    """Short-TTL result cache with single-flight for identical requests"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = OrderedDict()  # key -> (expires, result), oldest first
+        self._flights = {}
+    
+    def _purge(self, now):
+        while self._results:
+            key, (expires, _) = next(iter(self._results.items()))
+            if expires > now and len(self._results) <= config.VERIFY_DEDUP_MAX_ENTRIES:
+                return
+            self._results.popitem(last=False)
+    
+    def run(self, key, fn, cacheable=None):
+        """Return (result, duplicate) for key, calling fn() only if no recent result exists
+        
+        `cacheable(result)` decides whether a result is kept for the TTL
+        (waiters that joined the flight get it either way).
+        """
+        if config.VERIFY_DEDUP_TTL <= 0:
+            return fn(), False
+        
+        with self._lock:
+            now = time.monotonic()
+            self._purge(now)
+            cached = self._results.get(key)
+            if cached is not None:
+                return cached[1], True
+            flight = self._flights.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._flights[key] = _Flight()
+        
+        if not owner:
+            flight.done.wait()
+            return flight.result, True
+        
+        try:
+            flight.result = fn()
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.result is not None and (cacheable is None or cacheable(flight.result)):
+                    self._results[key] = (time.monotonic() + config.VERIFY_DEDUP_TTL, flight.result)
+            flight.done.set()
+        return flight.result, False
+
+_cache = IdempotencyCache()
+
+def get_cache():
+    """Get the process-wide /verify idempotency cache"""
+    return _cache
@@ -1,33 +1,81 @@
 #!/usr/bin/env python3
-import imagehash
-from PIL import Image
-from skimage.metrics import structural_similarity as ssim
 import numpy as np
 import cv2
-import io
+import time
 import base64
+import logging
+import random
+import threading
 import config
+import image_similarity
+
+logger = logging.getLogger(__name__)
+
+# Parallelism comes from worker processes; keep OpenCV from spawning a thread per core in each
+cv2.setNumThreads(config.CV_THREADS)
+
+# OpenCV objects are built once per thread and reused across calls
+_cv_objects = threading.local()
+
+def _cv(name):
+    """Get this thread's cached QR detector, CLAHE, ORB or BFMatcher"""
+    obj = getattr(_cv_objects, name, None)
+    if obj is None:
+        if name == 'qr_detector':
+            obj = cv2.QRCodeDetector()
+        elif name == 'clahe':
+            obj = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+        elif name == 'orb':
+            # Small patches so the 128px rectified code still yields enough keypoints
+            obj = cv2.ORB_create(nfeatures=500, edgeThreshold=15, patchSize=15)
+        elif name == 'matcher':
+            obj = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+        else:
+            raise KeyError(name)
+        setattr(_cv_objects, name, obj)
+    return obj
+
+def warm_up():
+    """Build this thread's OpenCV objects ahead of the first comparison"""
+    for name in ('qr_detector', 'clahe', 'orb', 'matcher'):
+        _cv(name)
 
 def compute_phash(image_data):
     """Compute perceptual hash of image"""
-    if isinstance(image_data, bytes):
-        image = Image.open(io.BytesIO(image_data))
-    elif isinstance(image_data, str):
-        # Base64 encoded image
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes))
-    else:
-        image = image_data
+    img = image_data if isinstance(image_data, np.ndarray) else decode_image(image_data)
     
     # Convert to grayscale for consistent hashing
-    if image.mode != 'L':
-        image = image.convert('L')
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     
-    return str(imagehash.phash(image))
+    return image_similarity.phash(img)
 
-def preprocess_image(img_data):
-    """Preprocess image according to exact algorithm"""
-    # Load image
+def rectify_qr_region(gray):
+    """Locate the QR code in a grayscale image and warp it to a square
+    
+    Returns a COMPARE_IMAGE_SIZE square covering exactly the code area
+    (corners ordered by the finder patterns, so rotation is undone too),
+    or None if no code is found.
+    """
+    scale = 1.0
+    if min(gray.shape) < config.QR_DETECT_MIN_SIZE:
+        # The detector misses finder patterns that are only a few pixels wide
+        scale = config.QR_DETECT_MIN_SIZE / min(gray.shape)
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+    
+    found, points = _cv('qr_detector').detect(gray)
+    if not found or points is None:
+        return None
+    corners = points.reshape(4, 2).astype(np.float32)
+    
+    size = config.COMPARE_IMAGE_SIZE
+    target = np.float32([[0, 0], [size - 1, 0], [size - 1, size - 1], [0, size - 1]])
+    matrix = cv2.getPerspectiveTransform(corners, target)
+    return cv2.warpPerspective(gray, matrix, (size, size), flags=cv2.INTER_AREA,
+                               borderValue=255)
+
+def decode_image(img_data):
+    """Decode raw bytes, a base64 string/data URL or a PIL image to a BGR array"""
     if isinstance(img_data, bytes):
         nparr = np.frombuffer(img_data, np.uint8)
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
@@ -42,37 +90,69 @@ def preprocess_image(img_data):
         # PIL Image
         img = cv2.cvtColor(np.array(img_data), cv2.COLOR_RGB2BGR)
     
+    if img is None:
+        raise ValueError("Could not decode image")
+    return img
+
+def crop_code_region(gray):
+    """Crop a clean rendered QR image to its code area (dark module bounding box)
+    
+    Frames the code like rectify_qr_region does, for canonical renders the
+    detector misses. Returns None if the image has no dark pixels.
+    """
+    ys, xs = np.nonzero(gray < 128)
+    if len(xs) == 0:
+        return None
+    crop = gray[ys.min():ys.max() + 1, xs.min():xs.max() + 1]
+    size = config.COMPARE_IMAGE_SIZE
+    return cv2.resize(crop, (size, size), interpolation=cv2.INTER_AREA)
+
+def _preprocess(img_data, rendered=False):
+    """Preprocess an image and return (processed, whether the QR code region was found)"""
+    # Load image unless already decoded
+    img = img_data if isinstance(img_data, np.ndarray) else decode_image(img_data)
+    
     # Convert to grayscale
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     
-    # Resize to canonical size 512x512
-    resized = cv2.resize(gray, (512, 512))
+    # Warp the QR code to a canonical square. Renders the detector misses are
+    # cropped to their code area; other images fall back to the whole frame.
+    resized = rectify_qr_region(gray)
+    if resized is None and rendered:
+        resized = crop_code_region(gray)
+    found = resized is not None
+    if resized is None:
+        size = config.COMPARE_IMAGE_SIZE
+        resized = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA)
     
     # Apply Gaussian blur (kernel 3x3)
     blurred = cv2.GaussianBlur(resized, (3, 3), 0)
     
     # Histogram equalization (CLAHE)
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    equalized = clahe.apply(blurred)
+    equalized = _cv('clahe').apply(blurred)
     
-    return equalized
+    return equalized, found
 
-def compute_orb_match_ratio(img1, img2):
-    """Compute ORB feature match ratio"""
+def preprocess_image(img_data, rendered=False):
+    """Preprocess image according to exact algorithm
+    
+    `rendered` marks a clean canonical render (see crop_code_region).
+    """
+    return _preprocess(img_data, rendered)[0]
+
+def compute_orb_descriptors(img):
+    """Compute ORB descriptors for a preprocessed image"""
+    keypoints, descriptors = _cv('orb').detectAndCompute(img, None)
+    return descriptors
+
+def match_orb_descriptors(des1, des2):
+    """Compute good match ratio between two ORB descriptor sets"""
     try:
-        # Initialize ORB detector
-        orb = cv2.ORB_create(nfeatures=500)
-        
-        # Detect keypoints and descriptors
-        kp1, des1 = orb.detectAndCompute(img1, None)
-        kp2, des2 = orb.detectAndCompute(img2, None)
-        
         if des1 is None or des2 is None or len(des1) < 10 or len(des2) < 10:
             return 0.0
         
         # Match descriptors using BFMatcher
-        bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-        matches = bf.match(des1, des2)
+        matches = _cv('matcher').match(des1, des2)
         
         # Sort matches by distance
         matches = sorted(matches, key=lambda x: x.distance)
@@ -82,67 +162,219 @@ def compute_orb_match_ratio(img1, img2):
         match_ratio = len(good_matches) / max(len(matches), 1)
         
         return match_ratio
+    
+    except Exception as e:
+        logger.warning("orb_match_error error=%r", e)
+        return 0.0
+
+def compute_orb_match_ratio(img1, img2):
+    """Compute ORB feature match ratio"""
+    try:
+        # Detect keypoints and descriptors
+        des1 = compute_orb_descriptors(img1)
+        des2 = compute_orb_descriptors(img2)
         
+        return match_orb_descriptors(des1, des2)
+    
     except Exception as e:
-        print(f"ORB matching error: {e}")
+        logger.warning("orb_match_error error=%r", e)
         return 0.0
 
-def compare_images(canonical_image_path, uploaded_image_data):
-    """Compare canonical image with uploaded image using exact algorithm"""
+def extract_features(img_data):
+    """Preprocess a canonical render and compute the features used by compare_images"""
+    processed = preprocess_image(img_data, rendered=True)
+    processed.flags.writeable = False
+    
+    return {
+        'processed': processed,
+        'phash': image_similarity.phash(processed),
+        'descriptors': compute_orb_descriptors(processed)
+    }
+
+def _visual_verdict(phash_distance, ssim_score=None, orb_ratio=None):
+    """Apply the staged decision rules to the metrics computed so far
+    
+    Returns True (tampered), False (genuine) or None when the next
+    stage is needed to decide.
+    """
+    if phash_distance > config.VISUAL_PHASH_TOLERANT:
+        return True
+    if ssim_score is None:
+        return False if phash_distance <= config.VISUAL_PHASH_ACCEPT else None
+    
+    if phash_distance <= config.VISUAL_PHASH_MAX and ssim_score >= config.VISUAL_SSIM_MIN:
+        return False  # OK - very tolerant for camera conditions
+    if ssim_score < config.VISUAL_SSIM_TOLERANT:
+        return True
+    if orb_ratio is None:
+        return None
+    # Very tolerant case for camera vs screen
+    return orb_ratio < config.VISUAL_ORB_MIN
+
+def compare_images(canonical, uploaded_image_data):
+    """Compare canonical image with uploaded image in cheapest-first stages
+    
+    `canonical` is either a path to the canonical PNG or a features dict
+    from extract_features (see feature_store for the cached variant).
+    pHash runs first and settles clear cases; SSIM and then ORB only run
+    while the verdict is still ambiguous. `stages` lists the stages that
+    ran and `stage_ms` their timings (plus decode and preprocess). Metrics
+    from skipped stages are None. If no QR code is found in the upload, no
+    verdict is given (visual_tamper None, visual_status 'no_qr_found'):
+    a whole frame cannot be compared with a rectified canonical. `similarity` is the SSIM score only
+    (None when SSIM was skipped); `phash_similarity` (1 - distance/64) is
+    always set and is on a different scale.
+    """
     try:
-        # Load and preprocess canonical image
-        with open(canonical_image_path, 'rb') as f:
-            canonical_data = f.read()
-        canonical_processed = preprocess_image(canonical_data)
+        stage_ms = {}
+        started = time.perf_counter()
         
-        # Preprocess uploaded image
-        uploaded_processed = preprocess_image(uploaded_image_data)
+        def finish_stage(name):
+            nonlocal started
+            now = time.perf_counter()
+            stage_ms[name] = round((now - started) * 1000, 3)
+            started = now
         
-        # Compute pHash on preprocessed images
-        canonical_pil = Image.fromarray(canonical_processed)
-        uploaded_pil = Image.fromarray(uploaded_processed)
+        # Load and preprocess canonical image unless features are precomputed
+        if isinstance(canonical, dict):
+            canonical_features = canonical
+        else:
+            with open(canonical, 'rb') as f:
+                canonical_data = f.read()
+            canonical_features = extract_features(canonical_data)
+        canonical_processed = canonical_features['processed']
+        canonical_phash = canonical_features['phash']
+        started = time.perf_counter()
         
-        canonical_phash = imagehash.phash(canonical_pil)
-        uploaded_phash = imagehash.phash(uploaded_pil)
+        # Decode and preprocess uploaded image
+        uploaded_image = decode_image(uploaded_image_data)
+        finish_stage('decode')
+        uploaded_processed, found = _preprocess(uploaded_image)
+        finish_stage('preprocess')
+        if not found:
+            return _no_qr_found_result(stage_ms)
         
-        # Compute Hamming distance
-        phash_distance = canonical_phash - uploaded_phash
+        # Stage 1: pHash Hamming distance on preprocessed images
+        uploaded_phash = image_similarity.phash(uploaded_processed)
+        phash_distance = image_similarity.hamming(canonical_phash, uploaded_phash)
+        ssim_score = None
+        orb_ratio = None
+        visual_tamper = _visual_verdict(phash_distance)
+        finish_stage('phash')
         
-        # Compute SSIM on preprocessed images
-        ssim_score = ssim(canonical_processed, uploaded_processed)
+        # Stage 2: SSIM, only when pHash alone is not conclusive
+        if visual_tamper is None:
+            ssim_score = image_similarity.ssim(canonical_processed, uploaded_processed,
+                                               config.SIMILARITY_SIZE)
+            visual_tamper = _visual_verdict(phash_distance, ssim_score)
+            finish_stage('ssim')
         
-        # Compute ORB match ratio
-        orb_ratio = compute_orb_match_ratio(canonical_processed, uploaded_processed)
+        # Stage 3: ORB match ratio for the remaining ambiguous band
+        if visual_tamper is None:
+            uploaded_descriptors = compute_orb_descriptors(uploaded_processed)
+            orb_ratio = match_orb_descriptors(canonical_features['descriptors'], uploaded_descriptors)
+            visual_tamper = _visual_verdict(phash_distance, ssim_score, orb_ratio)
+            finish_stage('orb')
         
-        # Apply decision rules (adjusted for camera vs screen conditions)
-        if phash_distance <= 25 and ssim_score >= 0.15:
-            visual_tamper = False  # OK - very tolerant for camera conditions
-        elif phash_distance <= 35 and ssim_score >= 0.10 and orb_ratio >= 0.05:
-            visual_tamper = False  # Very tolerant case for camera vs screen
-        else:
-            visual_tamper = True   # Tampered
+        stages = [name for name in stage_ms if name not in ('decode', 'preprocess')]
         
-        # Debug logging
-        print(f"Advanced image comparison results:")
-        print(f"  pHash distance: {phash_distance} (thresholds: ≤12 strict, ≤18 tolerant)")
-        print(f"  SSIM score: {ssim_score:.3f} (thresholds: ≥0.45 strict, ≥0.35 tolerant)")
-        print(f"  ORB match ratio: {orb_ratio:.3f} (threshold: ≥0.12)")
-        print(f"  Visual tamper: {visual_tamper}")
+        # Sampled debug logging (formatting is skipped entirely when not logged)
+        if logger.isEnabledFor(logging.DEBUG) and random.random() < config.COMPARE_LOG_SAMPLE_RATE:
+            logger.debug("image_comparison phash_distance=%d ssim=%s orb_ratio=%s stages=%s "
+                         "total_ms=%.1f visual_tamper=%s", phash_distance, ssim_score, orb_ratio,
+                         ",".join(stages), sum(stage_ms.values()), visual_tamper)
         
         return {
-            'similarity': float(ssim_score),
+            'similarity': float(ssim_score) if ssim_score is not None else None,
+            'phash_similarity': 1.0 - phash_distance / image_similarity.HASH_BITS,
             'visual_tamper': visual_tamper,
             'phash_distance': int(phash_distance),
-            'ssim_score': float(ssim_score),
-            'orb_ratio': float(orb_ratio),
-            'canonical_phash': str(canonical_phash),
-            'uploaded_phash': str(uploaded_phash)
+            'ssim_score': float(ssim_score) if ssim_score is not None else None,
+            'orb_ratio': float(orb_ratio) if orb_ratio is not None else None,
+            'canonical_phash': canonical_phash,
+            'uploaded_phash': uploaded_phash,
+            'stages': stages,
+            'stage_ms': stage_ms
         }
-        
+    
     except Exception as e:
-        print(f"Image comparison error: {e}")
+        logger.warning("image_comparison_error error=%r", e)
         return {
-            'similarity': 0.0,
+            'similarity': None,
             'visual_tamper': True,
             'error': str(e)
-        }
\ No newline at end of file
+        }
+
+def _no_qr_found_result(stage_ms=None):
+    result = {
+        'similarity': None,
+        'visual_tamper': None,
+        'visual_status': 'no_qr_found',
+        'stages': [],
+    }
+    if stage_ms is not None:
+        result['stage_ms'] = stage_ms
+    return result
+
+def compare_images_batch(canonicals, uploaded_images, size=None):
+    """Compare many uploads with their canonicals using vectorized pHash/SSIM
+    
+    `canonicals` are features dicts (as from extract_features) paired with
+    `uploaded_images` by position. Same staged rules as compare_images:
+    SSIM only runs, as one batched call at `size` (default SIMILARITY_SIZE),
+    on pairs pHash leaves undecided, and ORB only on pairs still undecided.
+    Uploads without a detectable QR code get no verdict, as in
+    compare_images. Returns one result dict per pair, without stage timings.
+    """
+    preprocessed = [_preprocess(image) for image in uploaded_images]
+    found = [i for i, (_, ok) in enumerate(preprocessed) if ok]
+    results = [_no_qr_found_result() for _ in preprocessed]
+    if found:
+        scored = compare_processed_batch([canonicals[i] for i in found],
+                                         [preprocessed[i][0] for i in found], size)
+        for i, result in zip(found, scored):
+            results[i] = result
+    return results
+
+def compare_processed_batch(canonicals, uploaded_processed, size=None):
+    """compare_images_batch for uploads already run through preprocess_image"""
+    uploaded = np.stack(uploaded_processed)
+    canonical = np.stack([features['processed'] for features in canonicals])
+    uploaded_phash = [image_similarity.bits_to_hex(bits) for bits in image_similarity.phash_bits(uploaded)]
+    distances = [image_similarity.hamming(features['phash'], phash)
+                 for features, phash in zip(canonicals, uploaded_phash)]
+    verdicts = [_visual_verdict(distance) for distance in distances]
+    ssim_scores = [None] * len(verdicts)
+    orb_ratios = [None] * len(verdicts)
+    
+    pending = [i for i, verdict in enumerate(verdicts) if verdict is None]
+    if pending:
+        size = size or config.SIMILARITY_SIZE
+        scores = image_similarity.ssim_batch(image_similarity.resize_stack(canonical[pending], size),
+                                             image_similarity.resize_stack(uploaded[pending], size))
+        for i, score in zip(pending, scores):
+            ssim_scores[i] = float(score)
+            verdicts[i] = _visual_verdict(distances[i], ssim_scores[i])
+    
+    for i, verdict in enumerate(verdicts):
+        if verdict is None:
+            orb_ratios[i] = match_orb_descriptors(canonicals[i]['descriptors'],
+                                                  compute_orb_descriptors(uploaded[i]))
+            verdicts[i] = _visual_verdict(distances[i], ssim_scores[i], orb_ratios[i])
+    
+    results = []
+    for i, features in enumerate(canonicals):
+        stages = ['phash'] + (['ssim'] if ssim_scores[i] is not None else []) + \
+                 (['orb'] if orb_ratios[i] is not None else [])
+        results.append({
+            'similarity': ssim_scores[i],
+            'phash_similarity': 1.0 - distances[i] / image_similarity.HASH_BITS,
+            'visual_tamper': verdicts[i],
+            'phash_distance': distances[i],
+            'ssim_score': ssim_scores[i],
+            'orb_ratio': float(orb_ratios[i]) if orb_ratios[i] is not None else None,
+            'canonical_phash': features['phash'],
+            'uploaded_phash': uploaded_phash[i],
+            'stages': stages,
+        })
+    return results
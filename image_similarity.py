@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+from functools import lru_cache
+import numpy as np
+import cv2
+import config
+
+# pHash and SSIM computed directly on preprocessed grayscale arrays, for one
+# pair or a whole (N, H, W) stack at once.
+# - pHash is bit-identical to imagehash.phash: a 32x32 Lanczos downscale
+#   (Pillow's fixed-point resampler as two matrix products; every partial
+#   sum is an integer below 2**53, so float64 BLAS is exact), a 2-D DCT-II,
+#   and the top-left 8x8 coefficients thresholded at their median. Hashes
+#   stored before this module existed stay comparable.
+# - SSIM follows skimage.metrics.structural_similarity defaults for uint8
+#   (7x7 uniform window, sample covariance, border of 3 excluded) in float32,
+#   within 1e-6 of skimage. A stack is box-filtered as one tall image: the
+#   windows that would straddle two images are the excluded border.
+# Stacks are processed SIMILARITY_CHUNK images at a time so the float
+# working set stays in cache; bigger chunks are slower, not faster.
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+DCT_SIZE = 32
+LANCZOS_SUPPORT = 3.0
+PIL_PRECISION_BITS = 22  # Pillow's 8-bit resampling precision (32 - 8 - 2)
+SSIM_WIN = 7
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+@lru_cache(maxsize=None)
+def _dct_rows():
+    """First HASH_SIZE rows of the unnormalized DCT-II matrix (as scipy.fftpack.dct)"""
+    k = np.arange(HASH_SIZE)[:, None]
+    n = np.arange(DCT_SIZE)[None, :]
+    return 2.0 * np.cos(np.pi * k * (2 * n + 1) / (2 * DCT_SIZE))
+
+def _lanczos(x):
+    return np.where(np.abs(x) < LANCZOS_SUPPORT, np.sinc(x) * np.sinc(x / LANCZOS_SUPPORT), 0.0)
+
+@lru_cache(maxsize=None)
+def _pil_resample_weights(in_size, out_size):
+    """Fixed-point Lanczos weights (out_size, in_size) as Pillow computes them"""
+    scale = in_size / out_size
+    filterscale = max(scale, 1.0)
+    support = LANCZOS_SUPPORT * filterscale
+    weights = np.zeros((out_size, in_size))
+    for xx in range(out_size):
+        center = (xx + 0.5) * scale
+        xmin = max(int(center - support + 0.5), 0)
+        xmax = min(int(center + support + 0.5), in_size)
+        k = _lanczos((np.arange(xmin, xmax) - center + 0.5) / filterscale)
+        weights[xx, xmin:xmax] = k / k.sum()
+    fixed = weights * (1 << PIL_PRECISION_BITS)
+    return np.where(fixed < 0, fixed - 0.5, fixed + 0.5).astype(np.int64)  # Truncates like the C cast
+
+def _pil_downscale(stack, size):
+    """Resize a uint8 stack like PIL's Image.resize(LANCZOS): horizontal pass, then vertical"""
+    n, height, width = stack.shape
+    half = float(1 << (PIL_PRECISION_BITS - 1))
+    one = float(1 << PIL_PRECISION_BITS)
+    out = stack.astype(np.float64)
+    if width != size:
+        cols = _pil_resample_weights(width, size).astype(np.float64)
+        out = out.reshape(n * height, width) @ cols.T  # One GEMM for the whole stack
+        out = np.clip(np.floor((out + half) / one), 0, 255).reshape(n, height, size)
+    if height != size:
+        rows = _pil_resample_weights(height, size).astype(np.float64)
+        out = np.clip(np.floor((rows @ out + half) / one), 0, 255)
+    return out
+
+def _as_stack(images):
+    stack = np.asarray(images)
+    return stack[None] if stack.ndim == 2 else stack
+
+def resize_stack(images, size):
+    """Resize a stack of grayscale images to size x size (no-op if already that size)"""
+    stack = _as_stack(images)
+    if stack.shape[1:] == (size, size):
+        return stack
+    interpolation = cv2.INTER_AREA if size < stack.shape[1] else cv2.INTER_LINEAR
+    return np.stack([cv2.resize(img, (size, size), interpolation=interpolation) for img in stack])
+
+def phash_bits(images):
+    """pHash bits of a stack as an (N, 64) bool array"""
+    small = _pil_downscale(_as_stack(images), DCT_SIZE)
+    dct = _dct_rows()
+    low = dct @ small @ dct.T  # (N, 8, 8): DCT along columns, then rows
+    low = low.reshape(len(low), HASH_BITS)
+    return low > np.median(low, axis=1, keepdims=True)
+
+def bits_to_hex(bits):
+    """Hex string of one 64-bit hash (row-major, first bit most significant, as imagehash)"""
+    return np.packbits(bits).tobytes().hex()
+
+def phash(image):
+    """pHash of one grayscale image as a 16-digit hex string"""
+    return bits_to_hex(phash_bits(image)[0])
+
+def hamming(hash_a, hash_b):
+    """Hamming distance between two hex hashes"""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count('1')
+
+def _window_means(stack):
+    """Mean over every full SSIM_WIN x SSIM_WIN window of each image in a float32 stack"""
+    n, height, width = stack.shape
+    pad = SSIM_WIN // 2
+    means = cv2.boxFilter(stack.reshape(n * height, width), cv2.CV_32F, (SSIM_WIN, SSIM_WIN))
+    return means.reshape(n, height, width)[:, pad:height - pad, pad:width - pad]
+
+def _ssim_chunk(a, b):
+    a = a.astype(np.float32)
+    b = b.astype(np.float32)
+    ux, uy = _window_means(a), _window_means(b)
+    uxx, uyy, uxy = _window_means(a * a), _window_means(b * b), _window_means(a * b)
+    
+    cov_norm = SSIM_WIN ** 2 / (SSIM_WIN ** 2 - 1)
+    vx = cov_norm * (uxx - ux * ux)
+    vy = cov_norm * (uyy - uy * uy)
+    vxy = cov_norm * (uxy - ux * uy)
+    
+    s = ((2 * ux * uy + SSIM_C1) * (2 * vxy + SSIM_C2)) / ((ux * ux + uy * uy + SSIM_C1) * (vx + vy + SSIM_C2))
+    return s.mean(axis=(1, 2), dtype=np.float64)
+
+def _chunked(fn, *stacks):
+    chunk = config.SIMILARITY_CHUNK
+    return np.concatenate([fn(*(stack[i:i + chunk] for stack in stacks))
+                           for i in range(0, len(stacks[0]), chunk)] or [np.empty(0)])
+
+def ssim_batch(images_a, images_b):
+    """Mean SSIM of each pair in two equally sized stacks, as an (N,) array"""
+    return _chunked(_ssim_chunk, _as_stack(images_a), _as_stack(images_b))
+
+def ssim(image_a, image_b, size=None):
+    """Mean SSIM of two equally sized grayscale images (resized to size x size if given)"""
+    if size:
+        image_a, image_b = resize_stack(image_a, size), resize_stack(image_b, size)
+    return float(ssim_batch(image_a, image_b)[0])
+
+def _phash_distance_chunk(a, b):
+    return (phash_bits(a) != phash_bits(b)).sum(axis=1)
+
+def phash_distances(images_a, images_b):
+    """pHash Hamming distance of each pair in two stacks, as an (N,) int array"""
+    return _chunked(_phash_distance_chunk, _as_stack(images_a), _as_stack(images_b)).astype(int)
+
+def score_batch(canonicals, uploads, size=None):
+    """Score each upload against its canonical in one vectorized call
+    
+    Both are stacks (or lists) of preprocessed grayscale images. pHash
+    uses them as they are; SSIM runs at size x size (default
+    SIMILARITY_SIZE). Returns (N,) arrays phash_distance and ssim.
+    """
+    canonicals, uploads = _as_stack(canonicals), _as_stack(uploads)
+    size = size or config.SIMILARITY_SIZE
+    return {
+        'phash_distance': phash_distances(canonicals, uploads),
+        'ssim': ssim_batch(resize_stack(canonicals, size), resize_stack(uploads, size)),
+    }
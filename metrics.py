@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+import threading
+import time
+from contextlib import contextmanager
+
+# Minimal Prometheus text-format metrics, kept in process memory. Under
+# gunicorn each worker reports its own values; scrape workers individually
+# or sum them in the query.
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_registry = []
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+class _Metric:
+    kind = None
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+    
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            for key, value in items:
+                lines.extend(self._render_value(key, value))
+        return lines
+    
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"]
+
+class Counter(_Metric):
+    kind = "counter"
+    
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self._values[()] = 0
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Counter):
+    kind = "gauge"
+    
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    kind = "histogram"
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+    
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (cumulated when rendered), then sum and count
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+    
+    def _render_value(self, key, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, key, [("le", bound)])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key, [("le", "+Inf")])
+        lines.append(f"{self.name}_bucket{labels} {count}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {total}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+def render():
+    """All registered metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# Verify hot path
+VERIFY_STAGE_SECONDS = Histogram(
+    "qr_verify_stage_seconds", "Time spent in each /verify stage", ("stage",))
+VERIFY_ERRORS = Counter(
+    "qr_verify_errors_total", "Failed verifications by error code", ("endpoint", "error"))
+VERIFY_REQUESTS = Counter(
+    "qr_verify_requests_total", "Verification requests handled", ("endpoint",))
+VERIFY_DUPLICATES = Counter(
+    "qr_verify_duplicates_total", "Requests answered from the idempotency window", ("endpoint",))
+COMPARISONS_IN_FLIGHT = Gauge(
+    "qr_image_comparisons_in_flight", "Image comparisons queued or running in the worker pool")
+
+@contextmanager
+def timed(stage):
+    """Observe the duration of the with-block as a /verify stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        VERIFY_STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+def observe_stage_ms(stage_ms):
+    """Record comparison stage timings ({stage: ms}) reported by compare_images"""
+    for stage, ms in stage_ms.items():
+        VERIFY_STAGE_SECONDS.observe(ms / 1000, stage=stage)
@@ -1,6 +1,184 @@
 #!/usr/bin/env python3
 import sqlite3
 import config
+import feature_store
+import phash_index
+
+SCAN_STATS_TABLES = """
+CREATE TABLE IF NOT EXISTS scan_stats (
+    serial TEXT PRIMARY KEY,
+    scan_count INTEGER NOT NULL DEFAULT 0,
+    first_ts DATETIME,
+    last_ts DATETIME,
+    visual_flag_count INTEGER NOT NULL DEFAULT 0,
+    distinct_devices INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS scan_devices (
+    serial TEXT NOT NULL,
+    device TEXT NOT NULL,
+    PRIMARY KEY (serial, device)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_scan_stats_count ON scan_stats(scan_count);
+"""
+
+SCAN_STATS_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS trg_scans_insert_stats AFTER INSERT ON scans
+BEGIN
+    INSERT OR IGNORE INTO scan_stats (serial, first_ts, last_ts) VALUES (NEW.serial, NEW.ts, NEW.ts);
+    UPDATE scan_stats SET
+        scan_count = scan_count + 1,
+        -- Imported scans keep their original ts, so they can predate the stored bounds
+        first_ts = MIN(IFNULL(first_ts, NEW.ts), NEW.ts),
+        last_ts = MAX(IFNULL(last_ts, NEW.ts), NEW.ts),
+        visual_flag_count = visual_flag_count + (IFNULL(NEW.visual_flag, 0) = 1),
+        distinct_devices = distinct_devices + (NOT EXISTS (
+            SELECT 1 FROM scan_devices WHERE serial = NEW.serial AND device = IFNULL(NEW.device, '')
+        ))
+    WHERE serial = NEW.serial;
+    INSERT OR IGNORE INTO scan_devices (serial, device) VALUES (NEW.serial, IFNULL(NEW.device, ''));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_scans_visual_flag_stats AFTER UPDATE OF visual_flag ON scans
+WHEN IFNULL(NEW.visual_flag, 0) != IFNULL(OLD.visual_flag, 0)
+BEGIN
+    UPDATE scan_stats SET
+        visual_flag_count = visual_flag_count + (IFNULL(NEW.visual_flag, 0) = 1) - (IFNULL(OLD.visual_flag, 0) = 1)
+    WHERE serial = NEW.serial;
+END;
+"""
+
+PHASH_INDEX_TABLE = """CREATE TABLE IF NOT EXISTS phash_index (
+    serial TEXT NOT NULL,
+    scan_id INTEGER NOT NULL,
+    phash TEXT NOT NULL,
+    c0 INTEGER NOT NULL,
+    c1 INTEGER NOT NULL,
+    c2 INTEGER NOT NULL,
+    c3 INTEGER NOT NULL,
+    PRIMARY KEY (serial, scan_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_phash_c0 ON phash_index(c0);
+CREATE INDEX IF NOT EXISTS idx_phash_c1 ON phash_index(c1);
+CREATE INDEX IF NOT EXISTS idx_phash_c2 ON phash_index(c2);
+CREATE INDEX IF NOT EXISTS idx_phash_c3 ON phash_index(c3);
+"""
+
+ARCHIVE_TABLES = """
+CREATE TABLE IF NOT EXISTS scan_rollups_hourly (
+    serial TEXT NOT NULL,
+    hour DATETIME NOT NULL,
+    scans INTEGER NOT NULL,
+    visual_flags INTEGER NOT NULL,
+    devices INTEGER NOT NULL,
+    PRIMARY KEY (serial, hour)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS scan_rollups_daily (
+    serial TEXT NOT NULL,
+    day DATE NOT NULL,
+    scans INTEGER NOT NULL,
+    visual_flags INTEGER NOT NULL,
+    devices INTEGER NOT NULL,
+    PRIMARY KEY (serial, day)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS scan_archive_log (
+    day DATE PRIMARY KEY,
+    state TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    archive_file TEXT NOT NULL,
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    max_id INTEGER NOT NULL DEFAULT 0,  -- Current pass covers the day's scans up to this id
+    archive_offset INTEGER  -- Archive size before the current pass appended to it
+);
+"""
+
+ANOMALY_STATE_TABLE = """
+CREATE TABLE IF NOT EXISTS anomaly_state (
+    serial TEXT PRIMARY KEY,
+    rate REAL NOT NULL,
+    updated REAL,
+    devices BLOB NOT NULL,
+    lat REAL,
+    lon REAL,
+    geo_ts REAL,
+    flags TEXT NOT NULL DEFAULT ''
+);
+"""
+
+REGISTRY_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS registry_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO registry_version (id, version) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_items_insert_version AFTER INSERT ON items
+BEGIN
+    UPDATE registry_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_items_update_version AFTER UPDATE ON items
+BEGIN
+    UPDATE registry_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_items_delete_version AFTER DELETE ON items
+BEGIN
+    UPDATE registry_version SET version = version + 1 WHERE id = 1;
+END;
+"""
+
+ADMIN_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_scans_ts ON scans(ts);
+CREATE INDEX IF NOT EXISTS idx_scans_serial_ts ON scans(serial, ts);
+CREATE INDEX IF NOT EXISTS idx_scans_device_ts ON scans(device, ts);
+CREATE INDEX IF NOT EXISTS idx_scans_visual_ts ON scans(visual_flag, ts);
+CREATE INDEX IF NOT EXISTS idx_items_batch ON items(batch);
+DROP INDEX IF EXISTS idx_scans_serial;
+"""
+
+def migrate_scan_stats(conn):
+    """Create scan_stats and backfill it from existing scans"""
+    exists = conn.execute("""
+        SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_scans_insert_stats'
+    """).fetchone()
+    if exists and "first_ts = MIN(" not in exists[0]:
+        # Older trigger set last_ts to every new ts, so back-dated imports moved it backwards.
+        # Only widen the bounds from live scans: archived days are no longer in the table
+        conn.executescript("BEGIN IMMEDIATE; DROP TRIGGER trg_scans_insert_stats;" + SCAN_STATS_TRIGGERS + """
+            UPDATE scan_stats SET (first_ts, last_ts) = (
+                SELECT MIN(IFNULL(first_ts, MIN(s.ts)), IFNULL(MIN(s.ts), first_ts)),
+                       MAX(IFNULL(last_ts, MAX(s.ts)), IFNULL(MAX(s.ts), last_ts))
+                FROM scans s WHERE s.serial = scan_stats.serial
+            );
+        COMMIT;""")
+        print("Updated trg_scans_insert_stats and repaired scan_stats first_ts/last_ts")
+        return
+    if exists:
+        print("scan_stats already maintained")
+        return
+    
+    # Backfill and install the triggers atomically so no scan is counted twice or missed
+    conn.executescript("BEGIN IMMEDIATE;" + SCAN_STATS_TABLES + """
+        DELETE FROM scan_stats;
+        DELETE FROM scan_devices;
+        
+        INSERT INTO scan_devices (serial, device)
+        SELECT DISTINCT serial, IFNULL(device, '') FROM scans;
+        
+        INSERT INTO scan_stats (serial, scan_count, first_ts, last_ts, visual_flag_count, distinct_devices)
+        SELECT s.serial, COUNT(*), MIN(s.ts), MAX(s.ts),
+               SUM(IFNULL(s.visual_flag, 0) = 1),
+               (SELECT COUNT(*) FROM scan_devices d WHERE d.serial = s.serial)
+        FROM scans s
+        GROUP BY s.serial;
+    """ + SCAN_STATS_TRIGGERS + "COMMIT;")
+    count = conn.execute("SELECT COUNT(*) FROM scan_stats").fetchone()[0]
+    print(f"Backfilled scan_stats for {count} serial(s)")
 
 def migrate_database():
     """Add new columns to existing database"""
@@ -26,8 +204,66 @@ def migrate_database():
         else:
             print(f"Error adding orb_ratio: {e}")
     
+    try:
+        cursor.execute("ALTER TABLE scans ADD COLUMN phash TEXT")
+        print("Added phash column")
+    except sqlite3.OperationalError as e:
+        if "duplicate column name" in str(e):
+            print("phash column already exists")
+        else:
+            print(f"Error adding phash: {e}")
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS canonical_features (
+            serial TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            signature TEXT NOT NULL,
+            phash TEXT NOT NULL,
+            processed BLOB NOT NULL,
+            descriptors BLOB,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (serial) REFERENCES items (serial)
+        )
+    """)
+    print("Ensured canonical_features table")
+    
+    cursor.executescript(PHASH_INDEX_TABLE)
+    print("Ensured phash_index table")
+    
+    # serial lookups are covered by idx_scans_serial_ts
+    cursor.executescript(ADMIN_INDEXES)
+    print("Ensured admin listing indexes")
+    
+    cursor.executescript(ARCHIVE_TABLES)
+    print("Ensured scan archive tables")
+    
+    for column in ("max_id INTEGER NOT NULL DEFAULT 0", "archive_offset INTEGER"):
+        try:
+            cursor.execute(f"ALTER TABLE scan_archive_log ADD COLUMN {column}")
+            print(f"Added scan_archive_log.{column.split()[0]}")
+        except sqlite3.OperationalError as e:
+            if "duplicate column name" not in str(e):
+                print(f"Error adding scan_archive_log.{column.split()[0]}: {e}")
+    # Days interrupted before the watermark existed cover all their live rows
+    cursor.execute("""
+        UPDATE scan_archive_log SET max_id = (
+            SELECT IFNULL(MAX(id), 0) FROM scans WHERE ts >= day AND ts < date(day, '+1 day'))
+        WHERE max_id = 0 AND state != 'done'
+    """)
+    
+    cursor.executescript(ANOMALY_STATE_TABLE)
+    print("Ensured anomaly_state table")
+    
+    cursor.executescript(REGISTRY_VERSION_TABLE)
+    print("Ensured registry_version table and triggers")
+    
     conn.commit()
+    migrate_scan_stats(conn)
     conn.close()
+    
+    # Precompute canonical image features for existing items
+    feature_store.backfill_features()
+    phash_index.rebuild_index()
     print("Database migration complete!")
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+import argparse
+import json
+from itertools import combinations
+import config
+import database
+
+# Multi-index hashing: each 64-bit pHash is split into PHASH_INDEX_CHUNKS
+# 16-bit chunks, each with its own SQLite index. Two hashes within Hamming
+# distance d must agree on at least one chunk to within d // chunks bits, so a
+# query only looks up those chunk neighbours instead of scanning every hash.
+CHUNK_BITS = 16
+CHUNK_HEX = CHUNK_BITS // 4
+
+INSERT_HASH_SQL = """
+    INSERT OR REPLACE INTO phash_index (serial, scan_id, phash, c0, c1, c2, c3)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+# One constant statement per chunk column; neighbour values are passed as a JSON array
+CHUNK_LOOKUP_SQL = [
+    f"SELECT serial, scan_id, phash FROM phash_index WHERE c{i} IN (SELECT value FROM json_each(?))"
+    for i in range(config.PHASH_INDEX_CHUNKS)
+]
+
+def chunk_values(phash):
+    """Split a 16-hex-digit pHash into its 16-bit chunk values"""
+    phash = str(phash)
+    return [int(phash[i * CHUNK_HEX:(i + 1) * CHUNK_HEX], 16) for i in range(config.PHASH_INDEX_CHUNKS)]
+
+def hamming(a, b):
+    return bin(int(str(a), 16) ^ int(str(b), 16)).count('1')
+
+def _neighbours(value, radius):
+    """All chunk values within `radius` flipped bits of value"""
+    values = [value]
+    for r in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), r):
+            flipped = value
+            for bit in bits:
+                flipped ^= 1 << bit
+            values.append(flipped)
+    return values
+
+def add_hashes(conn, entries):
+    """Index many (phash, serial, scan_id) entries (caller commits)
+    
+    scan_id is 0 for a serial's canonical image, so re-creating an item
+    replaces its canonical entry instead of adding another.
+    """
+    conn.executemany(INSERT_HASH_SQL, [
+        (serial, scan_id, str(phash), *chunk_values(phash))
+        for phash, serial, scan_id in entries
+    ])
+
+def add_hash(conn, phash, serial, scan_id=0):
+    """Index one pHash (caller commits)"""
+    add_hashes(conn, [(phash, serial, scan_id)])
+
+def find_within(conn, phash, distance):
+    """Return indexed hashes within `distance` bits of phash, nearest first
+    
+    Each match is {"serial", "scan_id", "phash", "distance"}; scan_id 0 is
+    a canonical image.
+    """
+    if distance > config.PHASH_INDEX_MAX_DISTANCE:
+        raise ValueError(f"Distance is limited to {config.PHASH_INDEX_MAX_DISTANCE}")
+    
+    radius = distance // config.PHASH_INDEX_CHUNKS
+    matches = {}
+    for sql, value in zip(CHUNK_LOOKUP_SQL, chunk_values(phash)):
+        for serial, scan_id, candidate in conn.execute(sql, (json.dumps(_neighbours(value, radius)),)):
+            if (serial, scan_id) in matches:
+                continue
+            candidate_distance = hamming(phash, candidate)
+            if candidate_distance <= distance:
+                matches[(serial, scan_id)] = {"serial": serial, "scan_id": scan_id,
+                                              "phash": candidate, "distance": candidate_distance}
+    return sorted(matches.values(), key=lambda m: (m["distance"], m["serial"], m["scan_id"]))
+
+def find_clones(conn, serial, distance):
+    """Find hashes under other serials that look like any print of `serial`
+    
+    Returns (hashes indexed for serial, matches under other serials).
+    """
+    own = conn.execute("SELECT scan_id, phash FROM phash_index WHERE serial = ?", (serial,)).fetchall()
+    matches = {}
+    for scan_id, phash in own:
+        for match in find_within(conn, phash, distance):
+            if match["serial"] == serial:
+                continue
+            key = (match["serial"], match["scan_id"])
+            if key not in matches or match["distance"] < matches[key]["distance"]:
+                matches[key] = dict(match, matched_scan_id=scan_id)
+    own_hashes = [{"scan_id": scan_id, "phash": phash} for scan_id, phash in own]
+    return own_hashes, sorted(matches.values(), key=lambda m: (m["distance"], m["serial"], m["scan_id"]))
+
+def _rebuild(conn):
+    conn.execute("DELETE FROM phash_index")
+    
+    # feature_store imports this module, so import lazily
+    import feature_store
+    canonical = conn.execute("SELECT phash, serial, 0 FROM canonical_features WHERE version = ?",
+                             (feature_store.FEATURE_VERSION,))
+    add_hashes(conn, canonical.fetchall())
+    scans = conn.execute("SELECT phash, serial, id FROM scans WHERE phash IS NOT NULL")
+    add_hashes(conn, scans.fetchall())
+    return conn.execute("SELECT COUNT(*) FROM phash_index").fetchone()[0]
+
+def rebuild_index():
+    """Rebuild the index from canonical_features and the scans table"""
+    count = database.run_write(_rebuild)
+    print(f"pHash index rebuilt with {count} hash(es)")
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="pHash similarity index")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index from the database")
+    parser.add_argument("--query", metavar="PHASH", help="List indexed hashes near this pHash")
+    parser.add_argument("--serial", help="List hashes under other serials near this serial's prints")
+    parser.add_argument("--distance", type=int, default=config.PHASH_CLONE_DISTANCE)
+    args = parser.parse_args()
+    
+    if args.rebuild:
+        rebuild_index()
+    conn = database.get_connection()
+    if args.query:
+        for match in find_within(conn, args.query, args.distance):
+            print(f"{match['distance']:3d}  {match['phash']}  {match['serial']}  scan {match['scan_id']}")
+    if args.serial:
+        _, matches = find_clones(conn, args.serial, args.distance)
+        for match in matches:
+            print(f"{match['distance']:3d}  {match['phash']}  {match['serial']}  scan {match['scan_id']}")
+    if not (args.rebuild or args.query or args.serial):
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
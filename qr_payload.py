@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+import base64
+import json
+import struct
+from datetime import date, timedelta
+
+# v2 QR content is "2:" + base45(message + signature). Base45 only uses the QR
+# alphanumeric character set, so the whole code is encoded in alphanumeric mode.
+V2_PREFIX = "2:"
+V2_NONCE_BYTES = 8
+SIGNATURE_BYTES = 64
+EPOCH = date(1970, 1, 1)
+
+# v2 fixed header: version, key id, mfg date (days since epoch), nonce
+_V2_HEADER = struct.Struct(f">B4sH{V2_NONCE_BYTES}s")
+
+BASE45_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+# Byte -> digit value lookup for bytes.translate (0xFF marks invalid characters)
+_BASE45_TABLE = bytes(BASE45_ALPHABET.index(chr(i)) if chr(i) in BASE45_ALPHABET else 0xFF
+                      for i in range(256))
+
+def b64url_encode(data):
+    """Encode bytes as unpadded base64url"""
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+def b64url_decode(text):
+    """Decode unpadded base64url"""
+    return base64.urlsafe_b64decode(text + '==')
+
+def b45encode(data):
+    """Encode bytes as base45 (RFC 9285)"""
+    chars = []
+    for i in range(0, len(data) - 1, 2):
+        n = data[i] * 256 + data[i + 1]
+        n, c = divmod(n, 45)
+        e, d = divmod(n, 45)
+        chars += (BASE45_ALPHABET[c], BASE45_ALPHABET[d], BASE45_ALPHABET[e])
+    if len(data) % 2:
+        d, c = divmod(data[-1], 45)
+        chars += (BASE45_ALPHABET[c], BASE45_ALPHABET[d])
+    return ''.join(chars)
+
+def b45decode(text):
+    """Decode base45 (RFC 9285), raising ValueError on malformed input"""
+    values = text.encode('ascii', 'replace').translate(_BASE45_TABLE)
+    if 0xFF in values:
+        raise ValueError("Invalid base45 character")
+    if len(values) % 3 == 1:
+        raise ValueError("Invalid base45 length")
+    
+    # Each 3-character group is one big-endian 16-bit word
+    full = len(values) - len(values) % 3
+    words = [c + d * 45 + e * 2025 for c, d, e in
+             zip(values[0:full:3], values[1:full:3], values[2:full:3])]
+    if words and max(words) > 0xFFFF:
+        raise ValueError("Invalid base45 group")
+    out = struct.pack(f">{len(words)}H", *words)
+    
+    if full < len(values):
+        n = values[full] + values[full + 1] * 45
+        if n > 0xFF:
+            raise ValueError("Invalid base45 group")
+        out += bytes((n,))
+    return out
+
+def encode_varint(n):
+    """Encode a non-negative integer as an unsigned LEB128 varint"""
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def decode_varint(data, offset):
+    """Decode a varint at offset, returning (value, next offset)"""
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(data) or shift > 28:
+            raise ValueError("Truncated varint")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+def pack_v1(payload):
+    """Encode a v1 payload dict as compact JSON message bytes"""
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+def pack_v2(serial, mfg, nonce, kid):
+    """Encode a v2 binary message
+    
+    Layout: version (1 byte) | key id (4 bytes) | mfg days since epoch
+    (uint16) | nonce (8 bytes) | varint length + UTF-8 serial. Product and
+    batch are not carried; the server fills them in from the registry.
+    """
+    serial_bytes = serial.encode('utf-8')
+    days = (date.fromisoformat(mfg) - EPOCH).days
+    header = _V2_HEADER.pack(2, bytes.fromhex(kid), days, nonce)
+    return header + encode_varint(len(serial_bytes)) + serial_bytes
+
+def unpack_v2(message_bytes):
+    """Decode a v2 binary message into a payload dict"""
+    if len(message_bytes) < _V2_HEADER.size:
+        raise ValueError("Truncated v2 payload")
+    version, kid, days, nonce = _V2_HEADER.unpack_from(message_bytes)
+    length, offset = decode_varint(message_bytes, _V2_HEADER.size)
+    if offset + length != len(message_bytes):
+        raise ValueError("Bad v2 serial length")
+    
+    return {
+        "v": version,
+        "kid": kid.hex(),
+        "s": message_bytes[offset:].decode('utf-8'),
+        "m": (EPOCH + timedelta(days=days)).isoformat(),
+        "r": b64url_encode(nonce)
+    }
+
+def parse_message(message_bytes):
+    """Parse message bytes of either version into a payload dict"""
+    if message_bytes[:1] == b'\x02':
+        return unpack_v2(message_bytes)
+    payload = json.loads(message_bytes.decode('utf-8'))
+    if not isinstance(payload, dict):
+        raise ValueError("Payload is not an object")
+    return payload
+
+def encode_qr_content(message_bytes, signature_bytes):
+    """Build the QR string for a signed message (format follows the message version)"""
+    if message_bytes[:1] == b'\x02':
+        return V2_PREFIX + b45encode(message_bytes + signature_bytes)
+    return f"{b64url_encode(message_bytes)}.{b64url_encode(signature_bytes)}"
+
+def decode_qr_content(qr_content):
+    """Split a QR string into (message_bytes, signature_bytes), raising ValueError"""
+    if qr_content.startswith(V2_PREFIX):
+        data = b45decode(qr_content[len(V2_PREFIX):])
+        if len(data) <= SIGNATURE_BYTES:
+            raise ValueError("Truncated v2 QR data")
+        return data[:-SIGNATURE_BYTES], data[-SIGNATURE_BYTES:]
+    
+    # Parse MSG.SIG format
+    if '.' not in qr_content:
+        raise ValueError("Invalid QR format")
+    message_b64, signature_b64 = qr_content.split('.', 1)
+    
+    # Decode message and signature
+    try:
+        return b64url_decode(message_b64), b64url_decode(signature_b64)
+    except Exception as e:
+        raise ValueError(f"Base64 decode error: {str(e)}")
+
+def stored_qr_content(message_b64, signature_b64):
+    """Rebuild the QR string from the items.message/items.signature columns"""
+    return encode_qr_content(b64url_decode(message_b64), b64url_decode(signature_b64))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+import io
+from pathlib import Path
+import qrcode
+from PIL import Image, ImageDraw, ImageFont
+import config
+import database
+import qr_payload
+
+# Canonical QR images are rendered from the stored message and signature
+# whenever they are needed rather than kept as one PNG file per serial.
+# Rendering is deterministic for a given payload, QR_BOX_SIZE and QR_BORDER.
+SHEET_ITEMS_SQL = "SELECT serial, message, signature FROM items ORDER BY serial"
+SHEET_BATCH_ITEMS_SQL = "SELECT serial, message, signature FROM items WHERE batch = ? ORDER BY serial"
+
+def make_qr_image(qr_content, box_size=None):
+    """Render QR content to a PIL image (box_size pixels per module)"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=box_size or config.QR_BOX_SIZE,
+        border=config.QR_BORDER,
+    )
+    qr.add_data(qr_content)
+    qr.make(fit=True)
+    return qr.make_image(fill_color="black", back_color="white").get_image()
+
+def render_qr_png(qr_content):
+    """Render QR content to PNG bytes"""
+    buffer = io.BytesIO()
+    make_qr_image(qr_content).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def render_item_png(message_b64, signature_b64):
+    """Regenerate an item's canonical PNG from its stored message and signature"""
+    return render_qr_png(qr_payload.stored_qr_content(message_b64, signature_b64))
+
+def _mm_to_px(mm):
+    return round(mm / 25.4 * config.SHEET_DPI)
+
+def iter_sheets(items):
+    """Tile (serial, qr_content) pairs into print sheets, yielding each page image
+    
+    Only the page being filled is held in memory. Codes are scaled by whole
+    pixels per module to about SHEET_CODE_MM wide, with the serial below.
+    Pages are bilevel (mode "1"), so PDFs store them as CCITT G4 rather than JPEG.
+    """
+    page_width, page_height = (_mm_to_px(mm) for mm in config.SHEET_PAGE_MM)
+    margin = _mm_to_px(config.SHEET_MARGIN_MM)
+    cell = _mm_to_px(config.SHEET_CELL_MM)
+    code_px = _mm_to_px(config.SHEET_CODE_MM)
+    cols = (page_width - 2 * margin) // cell
+    rows = (page_height - 2 * margin) // cell
+    if cols < 1 or rows < 1:
+        raise ValueError("Sheet cell does not fit on the page")
+    font = ImageFont.load_default()
+    
+    sheet = None
+    index = 0
+    for serial, qr_content in items:
+        if sheet is None:
+            sheet = Image.new("1", (page_width, page_height), 1)
+            draw = ImageDraw.Draw(sheet)
+        
+        code = make_qr_image(qr_content, box_size=1)
+        scale = max(1, code_px // code.width)
+        code = code.resize((code.width * scale, code.height * scale), Image.NEAREST)
+        
+        x = margin + (index % cols) * cell
+        y = margin + (index // cols) * cell
+        sheet.paste(code, (x + (cell - code.width) // 2, y))
+        text_width = draw.textlength(serial, font=font)
+        draw.text((x + (cell - text_width) / 2, y + code.height + 2), serial, fill=0, font=font)
+        
+        index += 1
+        if index == cols * rows:
+            yield sheet
+            sheet = None
+            index = 0
+    if sheet is not None:
+        yield sheet
+
+def iter_registry_codes(batch=None):
+    """Yield (serial, qr_content) for registered items in serial order, streamed from the DB"""
+    conn = database.get_connection()
+    cursor = conn.execute(SHEET_BATCH_ITEMS_SQL, (batch,)) if batch else conn.execute(SHEET_ITEMS_SQL)
+    while True:
+        rows = cursor.fetchmany(1000)
+        if not rows:
+            return
+        for serial, message_b64, signature_b64 in rows:
+            yield serial, qr_payload.stored_qr_content(message_b64, signature_b64)
+
+def export_sheets(out_dir, batch=None, fmt="pdf"):
+    """Write print sheets for the registry (or one batch) and return the page count
+    
+    PNG output is one file per page. PDF output appends pages to
+    sheets-NNNN.pdf files of SHEET_PDF_PAGES pages each.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    dpi = config.SHEET_DPI
+    
+    pages = 0
+    for sheet in iter_sheets(iter_registry_codes(batch)):
+        if fmt == "png":
+            path = out_dir / f"sheet-{pages + 1:05d}.png"
+            sheet.save(path, dpi=(dpi, dpi))
+        else:
+            path = out_dir / f"sheets-{pages // config.SHEET_PDF_PAGES + 1:04d}.pdf"
+            # Pages go in as incremental updates, so earlier pages are never re-encoded
+            sheet.save(path, "PDF", resolution=dpi, append=pages % config.SHEET_PDF_PAGES > 0)
+        pages += 1
+        if pages % 100 == 0:
+            print(f"  {pages} sheet(s) written")
+    return pages
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+from nacl.exceptions import BadSignatureError
+import metrics
+import qr_payload
+import signing_keys
+
+# QR string checks shared by the server and the offline edge verifier
+
+class QRError(Exception):
+    """QR verification failure carrying the API error code"""
+    
+    def __init__(self, error, detail):
+        super().__init__(detail)
+        self.error = error
+        self.detail = detail
+    
+    def response(self):
+        return {"ok": False, "error": self.error, "detail": self.detail}
+
+def check_qr_content(qr_content, keyring=None):
+    """Decode a QR string (v1 or v2) and verify its signature, returning (payload, serial)
+    
+    Uses the process-wide keyring unless one is given (the edge verifier
+    passes the keys from its snapshot). Raises QRError with the same error
+    codes /verify returns.
+    """
+    if not isinstance(qr_content, str):
+        raise QRError("bad_qr", "QR data must be a string")
+    
+    # Split into message and signature (dispatches on v1 MSG.SIG vs v2 base45)
+    with metrics.timed('qr_decode'):
+        try:
+            message_bytes, signature_bytes = qr_payload.decode_qr_content(qr_content)
+        except ValueError as e:
+            raise QRError("bad_qr", str(e))
+        
+        # Parse payload (only trusted once the signature checks out)
+        payload = None
+        payload_error = None
+        try:
+            payload = qr_payload.parse_message(message_bytes)
+        except Exception as e:
+            payload_error = e
+    kid = payload.get('kid') if payload else None
+    
+    # Verify signature against the key named by kid (keys are loaded once)
+    try:
+        with metrics.timed('signature_verify'):
+            (keyring or signing_keys.get_keyring()).verify(message_bytes, signature_bytes, kid)
+    except BadSignatureError:
+        raise QRError("invalid_signature", "Signature verification failed")
+    except Exception as e:
+        raise QRError("verify_error", str(e))
+    
+    if payload_error is not None:
+        raise QRError("bad_qr", f"Payload parse error: {str(payload_error)}")
+    serial = payload.get('s')
+    if not serial:
+        raise QRError("bad_qr", "Missing serial in payload")
+    
+    return payload, serial
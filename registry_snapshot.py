@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+import config
+import signing_keys
+
+# Read-only registry snapshot for offline edge verification. Sections are
+# 8-byte aligned and read in place through memoryviews over an mmap, so
+# opening a multi-million-item snapshot only parses the header and key set:
+#   hashes   uint64[count]  BLAKE2b-64 of each serial, sorted ascending
+#   meta     uint32[count * 2]  (product, batch) string ids, same order
+#   offsets  uint32[strings + 1]  start of each string in the blob
+#   blob     UTF-8 string data
+#   keys     JSON {"current": kid, "keys": {kid: public key base64url}}
+# Only serial hashes are stored; a colliding unregistered serial would still
+# need a valid signature to pass, as on the server.
+MAGIC = b"QRSNAP01"
+FORMAT_VERSION = 1
+SECTIONS = ("hashes", "meta", "offsets", "blob", "keys")
+# magic, format version, reserved, item count, created (unix), registry_version, then (offset, length) per section
+HEADER = struct.Struct("<8sIIQdQ" + "QQ" * len(SECTIONS))
+
+def serial_hash(serial):
+    """64-bit serial key used in snapshots"""
+    return int.from_bytes(hashlib.blake2b(serial.encode(), digest_size=8).digest(), 'little')
+
+def _check_byteorder():
+    # Arrays are written and read in native order, which the format fixes as little-endian
+    if sys.byteorder != 'little':
+        raise RuntimeError("Registry snapshots need a little-endian host")
+
+def export_snapshot(path=None):
+    """Compile the items table and verify keys into a snapshot file and return the item count
+    
+    The file is written next to the target and renamed into place, so a
+    verifier never opens a half-written snapshot.
+    """
+    import database
+    _check_byteorder()
+    path = path or config.EDGE_SNAPSHOT_PATH
+    conn = database.get_connection()
+    registry_version = conn.execute("SELECT version FROM registry_version WHERE id = 1").fetchone()[0]
+    
+    # Intern product/batch strings; sort entries as (hash << 64 | product id << 32 | batch id)
+    string_ids = {}
+    entries = []
+    cursor = conn.execute("SELECT serial, product, batch FROM items")
+    while True:
+        rows = cursor.fetchmany(10000)
+        if not rows:
+            break
+        for serial, product, batch in rows:
+            product_id = string_ids.setdefault(product, len(string_ids))
+            batch_id = string_ids.setdefault(batch, len(string_ids))
+            entries.append(serial_hash(serial) << 64 | product_id << 32 | batch_id)
+    entries.sort()
+    
+    hashes = array('Q', (entry >> 64 for entry in entries))
+    meta = array('I')
+    for entry in entries:
+        meta.append((entry >> 32) & 0xFFFFFFFF)
+        meta.append(entry & 0xFFFFFFFF)
+    count = len(entries)
+    del entries
+    
+    blob = bytearray()
+    offsets = [0]
+    for string in string_ids:  # Insertion order is id order
+        blob += string.encode()
+        offsets.append(len(blob))
+    
+    keys, current_kid = signing_keys.load_keys()
+    keys_json = json.dumps({
+        "current": current_kid,
+        "keys": {kid: signing_keys.encode_public_key(key) for kid, key in keys.items()},
+    }).encode()
+    
+    sections = [hashes.tobytes(), meta.tobytes(), array('I', offsets).tobytes(), bytes(blob), keys_json]
+    table = []
+    position = HEADER.size
+    for data in sections:
+        position += -position % 8
+        table += [position, len(data)]
+        position += len(data)
+    
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, count, time.time(), registry_version, *table))
+        for offset, data in zip(table[::2], sections):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return count
+
+class RegistrySnapshot:
+    """Memory-mapped snapshot with O(log n) serial lookups"""
+    
+    def __init__(self, path=None):
+        path = path or config.EDGE_SNAPSHOT_PATH
+        _check_byteorder()
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        header = HEADER.unpack_from(self._mmap)
+        magic, version, _, self.count, self.created, self.registry_version = header[:6]
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} registry snapshot")
+        view = memoryview(self._mmap)
+        table = header[6:]
+        section = {name: view[table[2 * i]:table[2 * i] + table[2 * i + 1]]
+                   for i, name in enumerate(SECTIONS)}
+        
+        self._hashes = section["hashes"].cast('Q')
+        self._meta = section["meta"].cast('I')
+        self._offsets = section["offsets"].cast('I')
+        self._blob = section["blob"]
+        # Every view must be released before the mmap can be closed
+        self._views = [self._hashes, self._meta, self._offsets, *section.values(), view]
+        keys = json.loads(bytes(section["keys"]))
+        self.keyring = signing_keys.Keyring(
+            {kid: signing_keys.decode_public_key(key) for kid, key in keys["keys"].items()},
+            keys["current"])
+    
+    def _string(self, string_id):
+        return str(self._blob[self._offsets[string_id]:self._offsets[string_id + 1]], 'utf-8')
+    
+    def lookup(self, serial):
+        """Return (product, batch) for a registered serial, or None"""
+        h = serial_hash(serial)
+        index = bisect_left(self._hashes, h)
+        if index == self.count or self._hashes[index] != h:
+            return None
+        return self._string(self._meta[2 * index]), self._string(self._meta[2 * index + 1])
+    
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._mmap.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the registry as an edge verifier snapshot")
+    parser.add_argument("--out", default=config.EDGE_SNAPSHOT_PATH,
+                        help=f"Snapshot path (default: {config.EDGE_SNAPSHOT_PATH})")
+    args = parser.parse_args()
+    
+    started = time.perf_counter()
+    count = export_snapshot(args.out)
+    print(f"Snapshot of {count} item(s) written to {args.out} "
+          f"({os.path.getsize(args.out) / 1e6:.1f} MB, {time.perf_counter() - started:.1f}s)")
+
+if __name__ == "__main__":
+    main()
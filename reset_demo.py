@@ -9,9 +9,18 @@ def reset_demo():
     
     # Clear all scans
     cursor.execute("DELETE FROM scans")
+    cursor.execute("DELETE FROM scan_stats")
+    cursor.execute("DELETE FROM scan_devices")
+    cursor.execute("DELETE FROM scan_rollups_hourly")
+    cursor.execute("DELETE FROM scan_rollups_daily")
+    cursor.execute("DELETE FROM scan_archive_log")
+    cursor.execute("DELETE FROM anomaly_state")
+    cursor.execute("DELETE FROM phash_index WHERE scan_id != 0")
     
     # Remove SERFake (keep only SERGenuine for demo)
     cursor.execute("DELETE FROM items WHERE serial = 'SERFake'")
+    cursor.execute("DELETE FROM canonical_features WHERE serial = 'SERFake'")
+    cursor.execute("DELETE FROM phash_index WHERE serial = 'SERFake'")
     
     # Show remaining items
     cursor.execute("SELECT serial, product, batch FROM items")
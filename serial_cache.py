@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+import config
+import database
+
+logger = logging.getLogger(__name__)
+
+# Registry lookups for the verify path. A Bloom filter over every registered
+# serial rejects unknown serials without touching the DB, and an LRU keeps the
+# few columns /verify needs for hot serials. Other processes (generator.py)
+# bump registry_version through triggers on items; the cache polls it every
+# SERIAL_CACHE_CHECK_INTERVAL seconds, adds new serials to the filter and
+# drops cached metadata. Deleted serials stay in the filter and simply fall
+# through to the DB.
+ItemInfo = namedtuple("ItemInfo", "product batch signature message")
+
+ITEM_INFO_SQL = "SELECT product, batch, signature, message FROM items WHERE serial = ?"
+REGISTRY_VERSION_SQL = "SELECT version FROM registry_version WHERE id = 1"
+SERIALS_AFTER_SQL = "SELECT rowid, serial FROM items WHERE rowid > ? ORDER BY rowid"
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on one 64-bit BLAKE2b digest)"""
+    
+    def __init__(self, capacity, error_rate):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+    
+    def _positions(self, value):
+        h = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'little')
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+    
+    def add(self, value):
+        self.add_many((value,))
+    
+    def add_many(self, values):
+        """Add an iterable of strings (the warm-up path, so the loop is kept tight)"""
+        bits, size, hashes = self.bits, self.size, range(self.hashes)
+        blake2b, from_bytes = hashlib.blake2b, int.from_bytes
+        added = 0
+        for value in values:
+            h = from_bytes(blake2b(value.encode(), digest_size=8).digest(), 'little')
+            h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+            for i in hashes:
+                pos = (h1 + i * h2) % size
+                bits[pos >> 3] |= 1 << (pos & 7)
+            added += 1
+        self.count += added
+    
+    def __contains__(self, value):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+class SerialCache:
+    """Bloom filter of registered serials plus an LRU of hot item metadata"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._max_rowid = 0
+        self._version = None
+        self._items = OrderedDict()
+        self._next_check = 0.0
+        self._warming = False
+    
+    def _load_serials(self, bloom, after_rowid):
+        """Add serials with rowid > after_rowid to bloom and return the last rowid"""
+        cursor = database.get_connection().execute(SERIALS_AFTER_SQL, (after_rowid,))
+        last = after_rowid
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                return last
+            bloom.add_many(serial for _, serial in rows)
+            last = rows[-1][0]
+    
+    def warm(self):
+        """Build the Bloom filter from every registered serial (safe to run in a thread)"""
+        conn = database.get_connection()
+        started = time.perf_counter()
+        version = conn.execute(REGISTRY_VERSION_SQL).fetchone()[0]
+        count = conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+        bloom = BloomFilter(max(config.SERIAL_BLOOM_MIN_CAPACITY, count * 2), config.SERIAL_BLOOM_ERROR_RATE)
+        max_rowid = self._load_serials(bloom, 0)
+        
+        with self._lock:
+            # Catch up on anything written while the filter was being built
+            max_rowid = self._load_serials(bloom, max_rowid)
+            self._bloom, self._max_rowid, self._version = bloom, max_rowid, version
+            self._items.clear()
+            self._warming = False
+        logger.info("serial_cache_warmed serials=%d bloom_bytes=%d seconds=%.2f",
+                    bloom.count, len(bloom.bits), time.perf_counter() - started)
+    
+    def start_warm(self):
+        """Warm in a background thread; lookups go to the DB until it finishes"""
+        with self._lock:
+            if self._warming:
+                return
+            self._warming = True
+        threading.Thread(target=self._warm_in_background, daemon=True).start()
+    
+    def _warm_in_background(self):
+        try:
+            self.warm()
+        except Exception as e:
+            with self._lock:
+                self._warming = False
+            logger.error("serial_cache_warm_error error=%r", e)
+    
+    def invalidate(self):
+        """Check the registry version on the next lookup (after local item writes)"""
+        self._next_check = 0.0
+    
+    def _refresh(self):
+        # Runs before warm-up finishes too: the LRU fills from the DB meanwhile
+        # and must still drop items that change
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + config.SERIAL_CACHE_CHECK_INTERVAL
+            version = database.get_connection().execute(REGISTRY_VERSION_SQL).fetchone()[0]
+            if version == self._version:
+                return
+            
+            self._version = version
+            self._items.clear()
+            if self._bloom is None:
+                return
+            self._max_rowid = self._load_serials(self._bloom, self._max_rowid)
+            needs_resize = self._bloom.count > self._bloom.capacity
+        if needs_resize:
+            # Error rate climbs past capacity; rebuild larger in the background
+            self.start_warm()
+    
+    def might_exist(self, serial):
+        """False only if serial is certainly not registered"""
+        self._refresh()
+        bloom = self._bloom
+        return bloom is None or serial in bloom
+    
+    def lookup(self, serial):
+        """Return ItemInfo for a registered serial, or None"""
+        self._refresh()
+        with self._lock:
+            item = self._items.get(serial)
+            if item is not None:
+                self._items.move_to_end(serial)
+                return item
+        
+        bloom = self._bloom
+        if bloom is not None and serial not in bloom:
+            return None
+        row = database.get_connection().execute(ITEM_INFO_SQL, (serial,)).fetchone()
+        if row is None:
+            return None
+        item = ItemInfo(*row)
+        with self._lock:
+            self._items[serial] = item
+            if len(self._items) > config.SERIAL_CACHE_SIZE:
+                self._items.popitem(last=False)
+        return item
+
+_cache = SerialCache()
+
+def get_cache():
+    """Get the process-wide serial cache"""
+    return _cache
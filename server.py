@@ -1,223 +1,633 @@
 #!/usr/bin/env python3
 import json
-import sqlite3
+import logging
+import os
 import base64
-from datetime import datetime
-from pathlib import Path
-from flask import Flask, request, jsonify, render_template_string, send_from_directory
-from nacl.signing import VerifyKey
-from nacl.exceptions import BadSignatureError
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta, timezone
+from flask import Flask, Response, request, jsonify, send_from_directory
 import config
-import image_compare
+import anomaly
+import compare_pool
+import blob_store
+import database
+import idempotency
+import metrics
+import phash_index
+from qr_verify import QRError, check_qr_content
+import serial_cache
+import signing_keys
 import base64
 
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = config.MAX_UPLOAD_BYTES
+
+# Verify-path statements, kept constant so each pooled connection prepares them once
+INSERT_SCAN_SQL = """
+    INSERT INTO scans (serial, device, meta, similarity, visual_flag, phash_distance, orb_ratio, phash)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+# Scans verified offline by edge verifiers keep their original timestamp
+INSERT_IMPORTED_SCAN_SQL = """
+    INSERT INTO scans (serial, ts, device, meta, similarity, visual_flag)
+    VALUES (?, ?, ?, ?, 1.0, 0)
+"""
+# scan_stats is maintained by triggers on scans, in the same transaction as the insert
+SCAN_COUNT_SQL = "SELECT scan_count FROM scan_stats WHERE serial = ?"
+
+# Batch lookups use fixed-width IN lists (padded with NULL) so the statements stay cacheable
+_IN_PARAMS = ", ".join("?" * config.VERIFY_BATCH_CHUNK)
+BATCH_ITEMS_SQL = f"SELECT serial, product, batch FROM items WHERE serial IN ({_IN_PARAMS})"
+BATCH_SCAN_COUNTS_SQL = f"SELECT serial, scan_count FROM scan_stats WHERE serial IN ({_IN_PARAMS})"
+
+def _record_scan(conn, serial, device, meta, similarity, visual_flag, phash_distance, orb_ratio, phash):
+    """Insert a scan row, index its pHash and return (scan_id, total scans for the serial)"""
+    cursor = conn.execute(INSERT_SCAN_SQL, (serial, device, meta, similarity, visual_flag,
+                                            phash_distance, orb_ratio, phash))
+    if phash:
+        phash_index.add_hash(conn, phash, serial, cursor.lastrowid)
+    scan_count = conn.execute(SCAN_COUNT_SQL, (serial,)).fetchone()[0]
+    return cursor.lastrowid, scan_count
+
+def _record_observed_scan(conn, meta_fields, serial, device, *scan_values):
+    """_record_scan plus the anomaly engine update; returns (scan_id, scan count, anomaly flags)"""
+    scan_id, scan_count = _record_scan(conn, serial, device, *scan_values)
+    with metrics.timed('anomaly'):
+        anomalies = anomaly.get_engine().observe(conn, serial, device, meta_fields)
+    return scan_id, scan_count, anomalies
+
+def _select_in_chunks(conn, sql, serials):
+    """Run a fixed-width IN query over serials in chunks and return all rows"""
+    rows = []
+    for start in range(0, len(serials), config.VERIFY_BATCH_CHUNK):
+        chunk = serials[start:start + config.VERIFY_BATCH_CHUNK]
+        chunk += [None] * (config.VERIFY_BATCH_CHUNK - len(chunk))
+        rows.extend(conn.execute(sql, chunk).fetchall())
+    return rows
+
+def _record_batch_scans(conn, scan_rows, serials, meta_fields):
+    """Insert scan rows in one transaction and return ({serial: total scans}, anomaly flags per row)"""
+    conn.executemany(INSERT_SCAN_SQL, scan_rows)
+    engine = anomaly.get_engine()
+    anomalies = [engine.observe(conn, row[0], row[1], meta_fields) for row in scan_rows]
+    return dict(_select_in_chunks(conn, BATCH_SCAN_COUNTS_SQL, serials)), anomalies
+
+def _device_name(device):
+    return 'unknown' if device is None else str(device)
 
-def load_public_key():
-    """Load public key from config or private key file"""
-    if config.PUBLIC_KEY_B64:
-        # Use environment override
-        key_bytes = base64.urlsafe_b64decode(config.PUBLIC_KEY_B64 + '==')
-        return VerifyKey(key_bytes)
+def _clean_meta(meta):
+    """Return (meta dict fit for scans.meta, legacy embedded image or None)
     
-    # Extract from private key file
-    if not Path(config.KEY_PATH).exists():
-        raise FileNotFoundError("No public key found. Set PUBLIC_KEY_B64 or generate keys.")
+    Form and query fields carry meta as a JSON string. The embedded image
+    is always taken out, and string values longer than SCAN_META_MAX_VALUE
+    are dropped, so scan rows stay small on every verify path.
+    """
+    if isinstance(meta, str):
+        try:
+            meta = json.loads(meta)
+        except ValueError:
+            meta = {}
+    if not isinstance(meta, dict):
+        return {}, None
+    meta = dict(meta)
+    image = meta.pop('image', None)
+    meta = {key: value for key, value in meta.items()
+            if not (isinstance(value, str) and len(value) > config.SCAN_META_MAX_VALUE)}
+    return meta, image
+
+def _read_verify_request():
+    """Read a /verify request as (data, image)
     
-    from nacl.signing import SigningKey
-    with open(config.KEY_PATH, 'rb') as f:
-        signing_key = SigningKey(f.read())
-    return signing_key.verify_key
+    Accepts JSON, multipart/form-data (qr, device and meta fields plus an
+    image file part), or a raw image/* body with qr and device in the query
+    string. `image` is raw bytes, a base64 string from legacy JSON clients
+    that embed it in meta, or None. The image is always removed from meta,
+    and device is always a string.
+    """
+    if request.mimetype == 'multipart/form-data':
+        data = request.form.to_dict()
+        image_file = request.files.get('image')
+        image = image_file.read() if image_file else None
+    elif request.mimetype.startswith('image/'):
+        data = request.args.to_dict()
+        image = request.get_data()
+    else:
+        data = request.get_json(silent=True) or {}
+        image = None
+    
+    data['meta'], legacy_image = _clean_meta(data.get('meta'))
+    image = image or legacy_image
+    # JSON clients may send a number; anomaly state and the scan row need text
+    data['device'] = _device_name(data.get('device'))
+    return data, image
 
 @app.route('/verify', methods=['POST'])
 def verify_qr():
     """Verify QR code signature and record scan"""
+    metrics.VERIFY_REQUESTS.inc(endpoint='verify')
+    with metrics.timed('total'):
+        result = _verify_qr()
+    if not result.get('ok'):
+        metrics.VERIFY_ERRORS.inc(endpoint='verify', error=result.get('error'))
+    return jsonify(result)
+
+def _verify_qr():
+    """Handle a /verify request and return the response dict
+    
+    Repeats of the same (qr, device, request id, with or without image)
+    within VERIFY_DEDUP_TTL get the first result back with "duplicate": true;
+    they are not verified or recorded again. The request id comes from an
+    Idempotency-Key header or a request_id field. Whether an image was sent
+    is part of the key, so a signature-only result never stands in for a
+    visual check; the image bytes are not, since each camera frame differs.
+    """
     try:
-        data = request.get_json()
+        data, image = _read_verify_request()
         if not data or 'qr' not in data:
-            return jsonify({"ok": False, "error": "bad_qr", "detail": "Missing QR data"})
-        
+            return {"ok": False, "error": "bad_qr", "detail": "Missing QR data"}
+    except Exception as e:
+        return {"ok": False, "error": "server_error", "detail": str(e)}
+    
+    request_id = request.headers.get('Idempotency-Key') or data.get('request_id')
+    key = (str(data['qr']), data['device'], str(request_id or ''), bool(image))
+    result, duplicate = idempotency.get_cache().run(
+        key, lambda: _verify_scan(data, image),
+        cacheable=lambda result: result.get('error') != 'server_error')
+    if duplicate:
+        metrics.VERIFY_DUPLICATES.inc(endpoint='verify')
+        result = dict(result, duplicate=True)
+    return result
+
+def _verify_scan(data, image):
+    """Verify one scan and record it, returning the response dict"""
+    try:
         qr_content = data['qr']
-        device = data.get('device', 'unknown')
-        meta = json.dumps(data.get('meta', {}))
+        device = data['device']
+        meta = data['meta']
         
-        # Parse MSG.SIG format
-        if '.' not in qr_content:
-            return jsonify({"ok": False, "error": "bad_qr", "detail": "Invalid QR format"})
-        
-        message_b64, signature_b64 = qr_content.split('.', 1)
-        
-        # Decode message and signature
         try:
-            message_bytes = base64.urlsafe_b64decode(message_b64 + '==')
-            signature_bytes = base64.urlsafe_b64decode(signature_b64 + '==')
-        except Exception as e:
-            return jsonify({"ok": False, "error": "bad_qr", "detail": f"Base64 decode error: {str(e)}"})
+            payload, serial = check_qr_content(qr_content)
+        except QRError as e:
+            return e.response()
         
-        # Verify signature
-        try:
-            public_key = load_public_key()
-            public_key.verify(message_bytes, signature_bytes)
-        except BadSignatureError:
-            return jsonify({"ok": False, "error": "invalid_signature", "detail": "Signature verification failed"})
-        except Exception as e:
-            return jsonify({"ok": False, "error": "verify_error", "detail": str(e)})
-        
-        # Parse payload
-        try:
-            payload = json.loads(message_bytes.decode('utf-8'))
-            serial = payload.get('s')
-            if not serial:
-                return jsonify({"ok": False, "error": "bad_qr", "detail": "Missing serial in payload"})
-        except Exception as e:
-            return jsonify({"ok": False, "error": "bad_qr", "detail": f"Payload parse error: {str(e)}"})
-        
-        # Check database for serial
-        conn = sqlite3.connect(config.DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM items WHERE serial = ?", (serial,))
-        item = cursor.fetchone()
+        # Registry lookup; the Bloom filter answers for unknown serials without the DB
+        with metrics.timed('db_lookup'):
+            item = serial_cache.get_cache().lookup(serial)
         
         if not item:
-            conn.close()
-            return jsonify({"ok": False, "error": "unknown_serial", "detail": f"Serial {serial} not found"})
+            return {"ok": False, "error": "unknown_serial", "detail": f"Serial {serial} not found"}
         
-        # Image comparison (if image provided)
-        similarity = 1.0
-        visual_tamper = False
+        # v2 payloads don't carry product/batch; fill them in from the registry
+        payload.setdefault('p', item.product)
+        payload.setdefault('b', item.batch)
         
-        # Check for uploaded image (multipart or base64 in meta)
-        uploaded_image = None
-        if 'image' in request.files and request.files['image']:
-            # Multipart upload
-            uploaded_image = request.files['image'].read()
-        elif 'meta' in data and isinstance(data['meta'], dict) and 'image' in data['meta']:
-            # Base64 in meta
+        # Decode legacy base64 / data URL images only once the QR checks out
+        uploaded_image = image
+        if isinstance(image, str):
             try:
-                image_b64 = data['meta']['image']
-                if image_b64.startswith('data:image/'):
-                    # Remove data URL prefix
-                    image_b64 = image_b64.split(',', 1)[1]
-                uploaded_image = base64.b64decode(image_b64)
+                with metrics.timed('image_b64_decode'):
+                    if image.startswith('data:image/'):
+                        # Remove data URL prefix
+                        image = image.split(',', 1)[1]
+                    uploaded_image = base64.b64decode(image)
             except Exception as e:
-                print(f"Base64 image decode error: {e}")
+                logger.warning("image_b64_decode_error serial=%s error=%r", serial, e)
+                uploaded_image = None
         
-        if uploaded_image:
-            # Get canonical image path from database
-            canonical_path = item[7]  # qr_path column
-            if canonical_path and Path(canonical_path).exists():
-                comparison_result = image_compare.compare_images(canonical_path, uploaded_image)
-                similarity = comparison_result['similarity']
-                visual_tamper = comparison_result['visual_tamper']
-        
-        # Record scan with detailed image comparison results
+        # Keep image bytes out of scans.meta; optionally keep the frame by content hash
+        if uploaded_image and config.STORE_SCAN_IMAGES:
+            meta['image_sha256'] = blob_store.store_blob(uploaded_image)
+        meta_fields = meta
+        meta = json.dumps(meta)
+        
+        # Image comparison (if image provided) runs in the worker pool so
+        # signature-only scans never wait behind it
+        similarity = 1.0
+        phash_similarity = None
+        visual_tamper = False
         phash_distance = None
         orb_ratio = None
+        phash = None
+        visual_status = None
+        future = None
         if uploaded_image:
-            phash_distance = comparison_result.get('phash_distance')
-            orb_ratio = comparison_result.get('orb_ratio')
+            try:
+                future = compare_pool.submit(serial, item.signature, item.message, uploaded_image)
+            except compare_pool.PoolBusy as e:
+                logger.warning("comparison_skipped serial=%s reason=%s", serial, e)
+                visual_status = "busy"
+            except compare_pool.PoolUnavailable as e:
+                logger.warning("comparison_skipped serial=%s reason=pool_unavailable error=%s", serial, e)
+                visual_status = "unavailable"
         
-        cursor.execute("""
-            INSERT INTO scans (serial, device, meta, similarity, visual_flag, phash_distance, orb_ratio)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (serial, device, meta, similarity, 1 if visual_tamper else 0, phash_distance, orb_ratio))
+        if future is not None and config.COMPARE_MODE == "sync":
+            try:
+                comparison_result = compare_pool.wait_result(future, config.COMPARE_TIMEOUT)
+                similarity, visual_flag, phash_distance, orb_ratio, phash = compare_pool.scan_result_values(comparison_result)
+                if comparison_result:
+                    phash_similarity = comparison_result.get('phash_similarity')
+                visual_status = (comparison_result or {}).get('visual_status', "checked")
+                visual_tamper = bool(visual_flag) if visual_status == "checked" else None
+                future = None
+            except FutureTimeoutError:
+                pass  # Scan row is filled in once the comparison completes
+            except compare_pool.PoolUnavailable as e:
+                # A comparison worker died; record the scan without a visual verdict
+                logger.warning("comparison_skipped serial=%s reason=pool_unavailable error=%s", serial, e)
+                visual_status = "unavailable"
+                future = None
         
-        # Count total scans
-        cursor.execute("SELECT COUNT(*) FROM scans WHERE serial = ?", (serial,))
-        scan_count = cursor.fetchone()[0]
+        if uploaded_image and visual_status != "checked":
+            # Visual verdict not known yet
+            similarity = None
+            visual_tamper = None
+            visual_status = visual_status or "pending"
         
-        # Check if flagged
-        flagged = scan_count > config.SCAN_FLAG_THRESHOLD
+        # Record scan with detailed image comparison results, plus the behavioral
+        # checks (scan velocity, device spread, impossible travel) in the same transaction
+        with metrics.timed('db_insert'):
+            scan_id, scan_count, anomalies = database.run_write(
+                _record_observed_scan, meta_fields, serial, device, meta, similarity,
+                1 if visual_tamper else 0, phash_distance, orb_ratio, phash)
+        flagged = bool(anomalies)
         
-        conn.commit()
-        conn.close()
+        if future is not None:
+            compare_pool.record_when_done(future, scan_id)
         
-        return jsonify({
+        response = {
             "ok": True,
             "serial": serial,
             "scans": scan_count,
             "flagged": flagged,
+            "anomalies": anomalies,
             "payload": payload,
             "visual_tamper": visual_tamper,
             "similarity": similarity
-        })
+        }
+        if phash_similarity is not None:
+            response["phash_similarity"] = phash_similarity
+        if visual_status:
+            response["visual_status"] = visual_status
+        return response
+    
+    except Exception as e:
+        return {"ok": False, "error": "server_error", "detail": str(e)}
+
+@app.route('/verify/batch', methods=['POST'])
+def verify_batch():
+    """Verify many QR codes in one request (signature-only) and record their scans"""
+    metrics.VERIFY_REQUESTS.inc(endpoint='batch')
+    with metrics.timed('batch_total'):
+        result = _verify_batch()
+    for item in result.get('results') or [result]:
+        if not item.get('ok'):
+            metrics.VERIFY_ERRORS.inc(endpoint='batch', error=item.get('error'))
+    return jsonify(result)
+
+def _verify_batch():
+    """Handle a /verify/batch request and return the response dict"""
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('qrs'), list):
+            return {"ok": False, "error": "bad_qr", "detail": "Missing qrs array"}
+        
+        qrs = data['qrs']
+        if len(qrs) > config.VERIFY_BATCH_MAX:
+            return {"ok": False, "error": "batch_too_large",
+                    "detail": f"At most {config.VERIFY_BATCH_MAX} QR codes per batch"}
+        
+        device = _device_name(data.get('device'))
+        # Signature-only: an embedded image is dropped along with oversized fields
+        meta_fields, _ = _clean_meta(data.get('meta'))
+        meta = json.dumps(meta_fields)
+        
+        # Decode and verify every signature up front with the cached keyring
+        results = [None] * len(qrs)
+        verified = []
+        for index, qr_content in enumerate(qrs):
+            try:
+                payload, serial = check_qr_content(qr_content)
+                verified.append((index, payload, serial))
+            except QRError as e:
+                results[index] = e.response()
+        
+        # Single registry lookup for all validly signed serials the Bloom filter doesn't rule out
+        conn = database.get_connection()
+        cache = serial_cache.get_cache()
+        serials = [serial for serial in {serial for _, _, serial in verified} if cache.might_exist(serial)]
+        known = {row[0]: row for row in _select_in_chunks(conn, BATCH_ITEMS_SQL, serials)}
+        
+        scan_rows = []
+        recorded = []
+        for index, payload, serial in verified:
+            if serial in known:
+                payload.setdefault('p', known[serial][1])
+                payload.setdefault('b', known[serial][2])
+                scan_rows.append((serial, device, meta, 1.0, 0, None, None, None))
+                recorded.append((index, payload, serial))
+            else:
+                results[index] = {"ok": False, "error": "unknown_serial", "detail": f"Serial {serial} not found"}
+        
+        # All scans and their anomaly state updates recorded in one transaction
+        scan_counts, anomaly_flags = {}, []
+        if scan_rows:
+            scan_counts, anomaly_flags = database.run_write(
+                _record_batch_scans, scan_rows, sorted(known), meta_fields)
+        
+        for (index, payload, serial), anomalies in zip(recorded, anomaly_flags):
+            results[index] = {
+                "ok": True,
+                "serial": serial,
+                "scans": scan_counts.get(serial, 0),
+                "flagged": bool(anomalies),
+                "anomalies": anomalies,
+                "payload": payload
+            }
+        
+        return {"ok": True, "count": len(results), "results": results}
+    
+    except Exception as e:
+        return {"ok": False, "error": "server_error", "detail": str(e)}
+
+@app.route('/verify/import', methods=['POST'])
+def verify_import():
+    """Record scans verified offline by edge verifiers (signatures are checked again)"""
+    metrics.VERIFY_REQUESTS.inc(endpoint='import')
+    result = _verify_import()
+    if not result.get('ok'):
+        metrics.VERIFY_ERRORS.inc(endpoint='import', error=result.get('error'))
+    return jsonify(result)
+
+def _record_imported_scans(conn, scan_rows, observed):
+    conn.executemany(INSERT_IMPORTED_SCAN_SQL, scan_rows)
+    # Replay into the anomaly engine in scan order (scans older than a serial's state are skipped)
+    engine = anomaly.get_engine()
+    for ts, serial, device, meta in sorted(observed, key=lambda entry: entry[0]):
+        engine.observe(conn, serial, device, meta, ts)
+
+def _verify_import():
+    """Handle a /verify/import request (edge journal upload) and return the response dict
+    
+    Body: {"scans": [{"qr", "ts" (unix seconds), "device", "meta"}, ...]}.
+    Entries that fail the usual /verify checks, have a ts in the future or
+    fall on a day archive_scans.py may already have archived are skipped
+    and listed in `rejected` by index; the rest are recorded in one
+    transaction.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data.get('scans'), list):
+            return {"ok": False, "error": "bad_qr", "detail": "Missing scans array"}
+        
+        scans = data['scans']
+        if len(scans) > config.VERIFY_BATCH_MAX:
+            return {"ok": False, "error": "batch_too_large",
+                    "detail": f"At most {config.VERIFY_BATCH_MAX} scans per import"}
+        
+        now = time.time()
+        # Same day granularity as archive_scans.py; scans.ts is UTC
+        cutoff_day = (datetime.fromtimestamp(now, timezone.utc)
+                      - timedelta(days=config.SCAN_RETENTION_DAYS)).strftime("%Y-%m-%d")
+        cache = serial_cache.get_cache()
+        scan_rows = []
+        observed = []
+        rejected = []
+        for index, scan in enumerate(scans):
+            if not isinstance(scan, dict):
+                rejected.append({"index": index, "error": "bad_qr", "detail": "Scan must be an object"})
+                continue
+            try:
+                payload, serial = check_qr_content(scan.get('qr'))
+                if cache.lookup(serial) is None:
+                    raise QRError("unknown_serial", f"Serial {serial} not found")
+                ts = float(scan.get('ts'))
+                ts_text = datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            except QRError as e:
+                rejected.append({"index": index, "error": e.error, "detail": e.detail})
+                continue
+            except (TypeError, ValueError, OverflowError, OSError):
+                rejected.append({"index": index, "error": "bad_ts", "detail": "ts must be unix seconds"})
+                continue
+            if ts > now + config.IMPORT_MAX_CLOCK_SKEW:
+                rejected.append({"index": index, "error": "bad_ts", "detail": "ts is in the future"})
+                continue
+            if ts_text[:10] < cutoff_day:
+                rejected.append({"index": index, "error": "too_old",
+                                 "detail": f"Scans before {cutoff_day} are past retention"})
+                continue
+            
+            device = str(scan.get('device') or 'edge')
+            meta = dict(_clean_meta(scan.get('meta'))[0], edge=True)
+            scan_rows.append((serial, ts_text, device, json.dumps(meta)))
+            observed.append((ts, serial, device, meta))
+        
+        if scan_rows:
+            database.run_write(_record_imported_scans, scan_rows, observed)
         
+        return {"ok": True, "imported": len(scan_rows), "rejected": rejected}
+    
+    except Exception as e:
+        return {"ok": False, "error": "server_error", "detail": str(e)}
+
+# Admin scan listing: newest first, keyset-paginated on (ts, id) so deep pages stay cheap
+ADMIN_SCANS_SQL = """
+    SELECT s.id, s.serial, s.ts, s.device, s.similarity, s.visual_flag, i.product, i.batch, s.phash_distance
+    FROM scans s
+    LEFT JOIN items i ON s.serial = i.serial
+    WHERE {where}
+    ORDER BY s.ts DESC, s.id DESC
+    LIMIT ?
+"""
+ADMIN_FILTERS = {
+    'serial': "s.serial = ?",
+    'batch': "s.serial IN (SELECT serial FROM items WHERE batch = ?)",
+    'device': "s.device = ?",
+    'since': "s.ts >= ?",
+    'until': "s.ts < ?",
+    'visual_flag': "s.visual_flag = ?",
+}
+ADMIN_FLAGGED_SQL = """
+    SELECT st.serial, st.scan_count, st.last_ts,
+           i.product, i.batch, st.distinct_devices, st.visual_flag_count
+    FROM scan_stats st
+    LEFT JOIN items i ON st.serial = i.serial
+    WHERE st.scan_count > ?
+    ORDER BY st.scan_count DESC
+    LIMIT ?
+"""
+ADMIN_SUMMARY_SQL = """
+    SELECT (SELECT COUNT(*) FROM items),
+           IFNULL(SUM(scan_count), 0),
+           IFNULL(SUM(visual_flag_count), 0),
+           IFNULL(SUM(scan_count > ?), 0)
+    FROM scan_stats
+"""
+
+_admin_cache = {}
+_admin_cache_lock = threading.Lock()
+
+def _cached(key, fn):
+    """Return fn() from the admin cache, recomputing after ADMIN_CACHE_TTL seconds"""
+    now = time.monotonic()
+    with _admin_cache_lock:
+        entry = _admin_cache.get(key)
+        if entry and now - entry[0] < config.ADMIN_CACHE_TTL:
+            return entry[1]
+    value = fn()
+    with _admin_cache_lock:
+        _admin_cache[key] = (now, value)
+    return value
+
+def _encode_cursor(ts, scan_id):
+    return base64.urlsafe_b64encode(f"{ts}|{scan_id}".encode()).decode()
+
+def _decode_cursor(cursor):
+    try:
+        ts, scan_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return ts, int(scan_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+def _page_size():
+    limit = request.args.get('limit', config.ADMIN_PAGE_SIZE, type=int)
+    return max(1, min(limit, config.ADMIN_PAGE_MAX))
+
+@app.route('/admin/api/scans')
+def admin_api_scans():
+    """List scans newest first, one page at a time
+    
+    Filters: serial, batch, device, since, until (timestamps as stored,
+    e.g. 2026-01-31 or 2026-01-31 12:00:00) and visual_flag (0/1). Pass
+    the returned next_cursor as ?cursor= to fetch the following page.
+    """
+    try:
+        clauses = []
+        params = []
+        for name, clause in ADMIN_FILTERS.items():
+            value = request.args.get(name)
+            if value in (None, ''):
+                continue
+            if name in ('since', 'until'):
+                value = value.replace('T', ' ')
+            elif name == 'visual_flag':
+                value = 1 if value.lower() in ('1', 'true', 'yes') else 0
+            clauses.append(clause)
+            params.append(value)
+        
+        cursor = request.args.get('cursor')
+        if cursor:
+            ts, scan_id = _decode_cursor(cursor)
+            clauses.append("(s.ts < ? OR (s.ts = ? AND s.id < ?))")
+            params.extend([ts, ts, scan_id])
+        
+        limit = _page_size()
+        sql = ADMIN_SCANS_SQL.format(where=" AND ".join(clauses) or "1")
+        rows = database.get_connection().execute(sql, params + [limit + 1]).fetchall()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1][2], rows[-1][0])
+        scans = [{
+            "id": row[0], "serial": row[1], "ts": row[2], "device": row[3],
+            "similarity": row[4], "visual_flag": bool(row[5]), "product": row[6], "batch": row[7],
+            "phash_distance": row[8]
+        } for row in rows]
+        return jsonify({"ok": True, "scans": scans, "next_cursor": next_cursor})
+    
+    except ValueError as e:
+        return jsonify({"ok": False, "error": "bad_request", "detail": str(e)})
     except Exception as e:
         return jsonify({"ok": False, "error": "server_error", "detail": str(e)})
 
-@app.route('/admin')
-def admin_panel():
-    """Admin panel showing recent scans and flagged items"""
-    conn = sqlite3.connect(config.DB_PATH)
-    cursor = conn.cursor()
+@app.route('/admin/api/flagged')
+def admin_api_flagged():
+    """Items scanned more than SCAN_FLAG_THRESHOLD times, most scanned first (cached)"""
+    limit = _page_size()
     
-    # Recent scans
-    cursor.execute("""
-        SELECT s.id, s.serial, s.ts, s.device, s.similarity, s.visual_flag,
-               i.product, i.batch
-        FROM scans s
-        LEFT JOIN items i ON s.serial = i.serial
-        ORDER BY s.ts DESC
-        LIMIT 50
-    """)
-    recent_scans = cursor.fetchall()
+    def load():
+        rows = database.get_connection().execute(
+            ADMIN_FLAGGED_SQL, (config.SCAN_FLAG_THRESHOLD, limit)).fetchall()
+        return [{
+            "serial": row[0], "scans": row[1], "last_ts": row[2], "product": row[3],
+            "batch": row[4], "devices": row[5], "visual_flags": row[6]
+        } for row in rows]
     
-    # Flagged items (high scan count)
-    cursor.execute("""
-        SELECT s.serial, COUNT(*) as scan_count, 
-               MAX(s.ts) as last_scan,
-               i.product, i.batch
-        FROM scans s
-        LEFT JOIN items i ON s.serial = i.serial
-        GROUP BY s.serial
-        HAVING scan_count > ?
-        ORDER BY scan_count DESC
-    """, (config.SCAN_FLAG_THRESHOLD,))
-    flagged_items = cursor.fetchall()
+    try:
+        return jsonify({"ok": True, "items": _cached(('flagged', limit), load)})
+    except Exception as e:
+        return jsonify({"ok": False, "error": "server_error", "detail": str(e)})
+
+@app.route('/admin/api/summary')
+def admin_api_summary():
+    """Registry-wide totals from scan_stats (cached)"""
+    def load():
+        items, scans, visual_flags, flagged = database.get_connection().execute(
+            ADMIN_SUMMARY_SQL, (config.SCAN_FLAG_THRESHOLD,)).fetchone()
+        return {"items": items, "scans": scans, "visual_flags": visual_flags, "flagged_items": flagged}
     
-    conn.close()
+    try:
+        return jsonify(dict(_cached('summary', load), ok=True))
+    except Exception as e:
+        return jsonify({"ok": False, "error": "server_error", "detail": str(e)})
+
+# Compiled once at import; the page loads its data from /admin/api/*
+ADMIN_TEMPLATE = app.jinja_env.from_string("""
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Anti-Counterfeit Admin Panel</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 20px; }
+        table { border-collapse: collapse; width: 100%; margin: 20px 0; }
+        th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
+        th { background-color: #f2f2f2; }
+        .flagged { background-color: #ffe6e6; }
+        .visual-tamper { background-color: #fff2e6; }
+        .filters input, .filters select { margin-right: 8px; }
+        h2 { color: #333; }
+    </style>
+</head>
+<body>
+    <h1>Anti-Counterfeit Admin Panel</h1>
+    <p id="summary"></p>
     
-    html = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Anti-Counterfeit Admin Panel</title>
-        <style>
-            body { font-family: Arial, sans-serif; margin: 20px; }
-            table { border-collapse: collapse; width: 100%; margin: 20px 0; }
-            th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
-            th { background-color: #f2f2f2; }
-            .flagged { background-color: #ffe6e6; }
-            .visual-tamper { background-color: #fff2e6; }
-            h2 { color: #333; }
-        </style>
-    </head>
-    <body>
-        <h1>Anti-Counterfeit Admin Panel</h1>
-        
-        <h2>Flagged Items (High Scan Count)</h2>
-        <table>
+    <h2>Flagged Items (more than {{ threshold }} scans)</h2>
+    <table>
+        <thead>
             <tr>
                 <th>Serial</th>
                 <th>Product</th>
                 <th>Batch</th>
                 <th>Scan Count</th>
+                <th>Devices</th>
+                <th>Visual Flags</th>
                 <th>Last Scan</th>
             </tr>
-            {% for item in flagged_items %}
-            <tr class="flagged">
-                <td>{{ item[0] }}</td>
-                <td>{{ item[3] or 'N/A' }}</td>
-                <td>{{ item[4] or 'N/A' }}</td>
-                <td>{{ item[1] }}</td>
-                <td>{{ item[2] }}</td>
-            </tr>
-            {% endfor %}
-        </table>
-        
-        <h2>Recent Scans</h2>
-        <table>
+        </thead>
+        <tbody id="flagged"></tbody>
+    </table>
+    
+    <h2>Recent Scans</h2>
+    <form class="filters" id="filters">
+        <input name="serial" placeholder="Serial">
+        <input name="batch" placeholder="Batch">
+        <input name="device" placeholder="Device">
+        <input name="since" type="datetime-local">
+        <input name="until" type="datetime-local">
+        <select name="visual_flag">
+            <option value="">Any</option>
+            <option value="1">Visual tamper</option>
+            <option value="0">No tamper</option>
+        </select>
+        <button type="submit">Filter</button>
+    </form>
+    <table>
+        <thead>
             <tr>
                 <th>ID</th>
                 <th>Serial</th>
@@ -228,24 +638,106 @@ def admin_panel():
                 <th>Similarity</th>
                 <th>Visual Tamper</th>
             </tr>
-            {% for scan in recent_scans %}
-            <tr class="{% if scan[5] %}visual-tamper{% endif %}">
-                <td>{{ scan[0] }}</td>
-                <td>{{ scan[1] }}</td>
-                <td>{{ scan[6] or 'N/A' }}</td>
-                <td>{{ scan[7] or 'N/A' }}</td>
-                <td>{{ scan[3] }}</td>
-                <td>{{ scan[2] }}</td>
-                <td>{{ "%.3f"|format(scan[4]) }}</td>
-                <td>{{ "Yes" if scan[5] else "No" }}</td>
-            </tr>
-            {% endfor %}
-        </table>
-    </body>
-    </html>
+        </thead>
+        <tbody id="scans"></tbody>
+    </table>
+    <button id="more" hidden>Load more</button>
+    
+    <script>
+        let nextCursor = null;
+        
+        function cell(value) {
+            const td = document.createElement('td');
+            td.textContent = value === null || value === undefined ? 'N/A' : value;
+            return td;
+        }
+        
+        function addRow(tbody, className, values) {
+            const tr = document.createElement('tr');
+            tr.className = className;
+            values.forEach(value => tr.appendChild(cell(value)));
+            tbody.appendChild(tr);
+        }
+        
+        async function loadSummary() {
+            const s = await (await fetch('/admin/api/summary')).json();
+            document.getElementById('summary').textContent =
+                `${s.items} items, ${s.scans} scans, ${s.flagged_items} flagged, ${s.visual_flags} visual flags`;
+        }
+        
+        async function loadFlagged() {
+            const data = await (await fetch('/admin/api/flagged')).json();
+            const tbody = document.getElementById('flagged');
+            tbody.replaceChildren();
+            data.items.forEach(item => addRow(tbody, 'flagged', [item.serial, item.product, item.batch,
+                item.scans, item.devices, item.visual_flags, item.last_ts]));
+        }
+        
+        async function loadScans(append) {
+            const params = new URLSearchParams(new FormData(document.getElementById('filters')));
+            if (append && nextCursor) params.set('cursor', nextCursor);
+            const data = await (await fetch('/admin/api/scans?' + params)).json();
+            const tbody = document.getElementById('scans');
+            if (!append) tbody.replaceChildren();
+            data.scans.forEach(scan => addRow(tbody, scan.visual_flag ? 'visual-tamper' : '', [
+                scan.id, scan.serial, scan.product, scan.batch, scan.device, scan.ts,
+                scan.similarity !== null ? scan.similarity.toFixed(3) :
+                    scan.phash_distance !== null ? 'pHash d=' + scan.phash_distance : 'pending',
+                scan.visual_flag ? 'Yes' : 'No']));
+            nextCursor = data.next_cursor;
+            document.getElementById('more').hidden = !nextCursor;
+        }
+        
+        document.getElementById('filters').addEventListener('submit', event => {
+            event.preventDefault();
+            loadScans(false);
+        });
+        document.getElementById('more').addEventListener('click', () => loadScans(true));
+        
+        loadSummary();
+        loadFlagged();
+        loadScans(false);
+    </script>
+</body>
+</html>
+""")
+
+@app.route('/admin')
+def admin_panel():
+    """Admin panel showing recent scans and flagged items"""
+    return ADMIN_TEMPLATE.render(threshold=config.SCAN_FLAG_THRESHOLD)
+
+@app.route('/admin/phash')
+def admin_phash():
+    """Find scans and canonical images under other serials that share a visual fingerprint
+    
+    Query with ?serial=SERIAL (all prints of that serial) or ?phash=HEX,
+    plus an optional &distance=N (Hamming bits).
     """
+    try:
+        distance = request.args.get('distance', config.PHASH_CLONE_DISTANCE, type=int)
+        conn = database.get_connection()
+        serial = request.args.get('serial')
+        if serial:
+            hashes, matches = phash_index.find_clones(conn, serial, distance)
+            return jsonify({"ok": True, "serial": serial, "distance": distance,
+                            "hashes": hashes, "matches": matches})
+        
+        phash = request.args.get('phash')
+        if not phash:
+            return jsonify({"ok": False, "error": "bad_request", "detail": "Pass serial or phash"})
+        matches = phash_index.find_within(conn, phash, distance)
+        return jsonify({"ok": True, "phash": phash, "distance": distance, "matches": matches})
     
-    return render_template_string(html, recent_scans=recent_scans, flagged_items=flagged_items)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": "bad_request", "detail": str(e)})
+    except Exception as e:
+        return jsonify({"ok": False, "error": "server_error", "detail": str(e)})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text-format metrics for this process"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/static/<path:filename>')
 def serve_static(filename):
@@ -257,9 +749,20 @@ def index():
     """Root route with basic info"""
     return jsonify({
         "service": "Anti-Counterfeit QR Verification",
-        "endpoints": ["/verify", "/admin", "/static/*"],
+        "endpoints": ["/verify", "/verify/batch", "/verify/import", "/admin", "/admin/api/scans", "/admin/api/flagged",
+                      "/admin/api/summary", "/admin/phash", "/metrics", "/static/*"],
         "status": "running"
     })
 
 if __name__ == '__main__':
+    logging.basicConfig(level=config.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    signing_keys.install_reload_signal()
+    # Load the verify keys before the first request instead of inside it
+    signing_keys.get_keyring().keys()
+    # Comparison workers import the imaging stack and the serial filter warms in the background
+    # while the server binds
+    # (in the reloader's child only, when debug is on)
+    if not config.DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        compare_pool.warm_up()
+        serial_cache.get_cache().start_warm()
     app.run(host=config.FLASK_HOST, port=config.FLASK_PORT, debug=config.DEBUG)
\ No newline at end of file
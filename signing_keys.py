@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+import base64
+import hashlib
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from nacl.signing import SigningKey, VerifyKey
+from nacl.exceptions import BadSignatureError
+import config
+
+logger = logging.getLogger(__name__)
+
+def key_id(verify_key):
+    """Derive the short key id carried in payloads as `kid`"""
+    return hashlib.sha256(verify_key.encode()).hexdigest()[:8]
+
+def decode_public_key(public_key_b64):
+    """Decode a base64url public key into a VerifyKey"""
+    return VerifyKey(base64.urlsafe_b64decode(public_key_b64 + '=' * (-len(public_key_b64) % 4)))
+
+def encode_public_key(verify_key):
+    """Encode a VerifyKey as unpadded base64url"""
+    return base64.urlsafe_b64encode(verify_key.encode()).decode().rstrip('=')
+
+def _source_paths():
+    return (config.KEY_PATH, config.KEYRING_PATH)
+
+def _source_mtimes():
+    mtimes = []
+    for path in _source_paths():
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+def load_keys():
+    """Load (keys by kid, current kid) from config and key files
+    
+    The current key comes from PUBLIC_KEY_B64 (comma-separated, first is
+    current) or the private key file. Retired keys listed in KEYRING_PATH
+    stay valid so labels printed before a rotation keep verifying.
+    """
+    keys = {}
+    current_kid = None
+    
+    if os.path.exists(config.KEYRING_PATH):
+        with open(config.KEYRING_PATH, 'r') as f:
+            for public_key_b64 in json.load(f).values():
+                verify_key = decode_public_key(public_key_b64)
+                keys[key_id(verify_key)] = verify_key
+    
+    if config.PUBLIC_KEY_B64:
+        # Use environment override
+        for public_key_b64 in config.PUBLIC_KEY_B64.split(','):
+            verify_key = decode_public_key(public_key_b64.strip())
+            keys[key_id(verify_key)] = verify_key
+            current_kid = current_kid or key_id(verify_key)
+    elif os.path.exists(config.KEY_PATH):
+        # Extract from private key file
+        with open(config.KEY_PATH, 'rb') as f:
+            verify_key = SigningKey(f.read()).verify_key
+        current_kid = key_id(verify_key)
+        keys[current_kid] = verify_key
+    
+    if not keys:
+        raise FileNotFoundError("No public key found. Set PUBLIC_KEY_B64 or generate keys.")
+    return keys, current_kid
+
+class Keyring:
+    """Verify keys indexed by key id, loaded once and hot-reloaded on change
+    
+    A keyring built with explicit keys (e.g. from an edge snapshot) never
+    reads the key files.
+    """
+    
+    def __init__(self, keys=None, current_kid=None):
+        self._lock = threading.Lock()
+        self._keys = keys or {}
+        self._current_kid = current_kid
+        self._static = keys is not None
+        self._mtimes = None
+        self._next_check = 0.0
+        self._reload_requested = False
+    
+    def request_reload(self):
+        """Reload on next use (safe to call from a signal handler)"""
+        self._reload_requested = True
+    
+    def _is_fresh(self, now):
+        return bool(self._keys) and not self._reload_requested and now < self._next_check
+    
+    def _refresh(self):
+        now = time.monotonic()
+        if self._static or self._is_fresh(now):
+            return
+        
+        # Readers wait here while the keyring is still empty
+        with self._lock:
+            if self._is_fresh(now):
+                return
+            mtimes = _source_mtimes()
+            if mtimes != self._mtimes or self._reload_requested or not self._keys:
+                self._reload_requested = False
+                try:
+                    keys, current_kid = load_keys()
+                except Exception as e:
+                    if not self._keys:
+                        raise
+                    logger.warning("keyring_reload_failed keeping_previous_keys error=%r", e)
+                else:
+                    self._keys, self._current_kid = keys, current_kid
+                    self._mtimes = mtimes
+            # Published only after the keys are in place, so the unlocked fast
+            # path never sees a deadline without keys; the files are only
+            # stat'ed every KEYRING_CHECK_INTERVAL seconds
+            self._next_check = now + config.KEYRING_CHECK_INTERVAL
+    
+    def keys(self):
+        """Return the current {kid: VerifyKey} mapping"""
+        self._refresh()
+        return self._keys
+    
+    def verify(self, message_bytes, signature_bytes, kid=None):
+        """Verify a signature, raising BadSignatureError if no key accepts it
+        
+        Payloads with a `kid` are checked against that key only. Legacy
+        payloads without one try the current key first, then retired keys.
+        """
+        keys = self.keys()
+        if kid is not None:
+            verify_key = keys.get(kid)
+            if verify_key is None:
+                raise BadSignatureError(f"Unknown key id: {kid}")
+            verify_key.verify(message_bytes, signature_bytes)
+            return kid
+        
+        candidates = sorted(keys.items(), key=lambda entry: entry[0] != self._current_kid)
+        for candidate_kid, verify_key in candidates:
+            try:
+                verify_key.verify(message_bytes, signature_bytes)
+                return candidate_kid
+            except BadSignatureError:
+                continue
+        raise BadSignatureError("Signature verification failed")
+
+_keyring = Keyring()
+
+def get_keyring():
+    """Get the process-wide keyring"""
+    return _keyring
+
+def install_reload_signal():
+    """Reload the keyring on SIGHUP where the platform supports it"""
+    if not hasattr(signal, 'SIGHUP'):
+        return False
+    try:
+        signal.signal(signal.SIGHUP, lambda signum, frame: _keyring.request_reload())
+    except ValueError:
+        # Not on the main thread
+        return False
+    return True
+
+def retire_key(verify_key):
+    """Add a public key to the retired-key file so its labels stay valid"""
+    entries = {}
+    if os.path.exists(config.KEYRING_PATH):
+        with open(config.KEYRING_PATH, 'r') as f:
+            entries = json.load(f)
+    entries[key_id(verify_key)] = encode_public_key(verify_key)
+    
+    tmp_path = f"{config.KEYRING_PATH}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(entries, f, indent=2)
+    os.replace(tmp_path, config.KEYRING_PATH)
@@ -0,0 +1,22 @@
+import shutil
+import sys
+from pathlib import Path
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Temp dir with fresh keys and an empty database, as the working directory"""
+    (tmp_path / "db").mkdir()
+    (tmp_path / "sample_data").mkdir()
+    shutil.copy(REPO_ROOT / "db" / "schema.sql", tmp_path / "db" / "schema.sql")
+    monkeypatch.chdir(tmp_path)
+    
+    import database
+    import generator
+    generator.generate_keys()
+    generator.init_database()
+    yield tmp_path
+    database.close_connection()
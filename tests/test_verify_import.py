@@ -0,0 +1,26 @@
+import time
+
+def _stats(serial):
+    import database
+    return database.get_connection().execute(
+        "SELECT scan_count, first_ts, last_ts FROM scan_stats WHERE serial = ?", (serial,)).fetchone()
+
+def test_import_of_older_scan_keeps_scan_stats_bounds(workspace):
+    import generator
+    import server
+    
+    qr_content = generator.create_qr_item("TEST", "SERIMPORT", "B1")
+    client = server.app.test_client()
+    assert client.post("/verify", json={"qr": qr_content, "device": "live"}).get_json()["ok"]
+    _, first_ts, last_ts = _stats("SERIMPORT")
+    
+    # An edge verifier uploads a scan made an hour before the live one
+    result = client.post("/verify/import", json={
+        "scans": [{"qr": qr_content, "ts": time.time() - 3600, "device": "edge"}]
+    }).get_json()
+    assert result["ok"] and result["imported"] == 1
+    
+    scan_count, new_first_ts, new_last_ts = _stats("SERIMPORT")
+    assert scan_count == 2
+    assert new_first_ts < first_ts
+    assert new_last_ts == last_ts
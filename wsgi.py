@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+# Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+# With preload_app this module is imported once in the master, so OpenCV,
+# NumPy and the verify keys are loaded before workers fork (the
+# comparison processes each worker forks inherit them), and the serial Bloom
+# filter is built once and shared copy-on-write. Per-process resources
+# (DB connections, the comparison pool) are opened after fork.
+import logging
+import config
+import image_compare
+import serial_cache
+import signing_keys
+from server import app
+
+logging.basicConfig(level=config.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+signing_keys.get_keyring().keys()
+serial_cache.get_cache().warm()